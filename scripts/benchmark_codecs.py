@@ -0,0 +1,106 @@
+from src.config import RECORDER
+from src.episode import encode_image, decode_image, filter_kwargs, read_frames, hdf5plugin
+import h5py
+import numpy as np
+import time
+import click
+
+
+# Candidate storage options, same format as RECORDER["datasets"]
+CANDIDATES = {
+    "raw": {},
+    "gzip-1": {"compression": "gzip", "level": 1},
+    "shuffle+gzip-1": {"compression": "gzip", "level": 1, "shuffle": True},
+    "shuffle+lzf": {"compression": "lzf", "shuffle": True},
+    "shuffle+lz4": {"compression": "lz4", "level": 5, "shuffle": True},
+    "shuffle+zstd-1": {"compression": "zstd", "level": 1, "shuffle": True},
+    "shuffle+zstd-3": {"compression": "zstd", "level": 3, "shuffle": True},
+    "png-1": {"codec": "png", "level": 1},
+    "png-3": {"codec": "png", "level": 3},
+    "jpg-90": {"codec": "jpg", "level": 90, "lossy": True},
+    "webp-90": {"codec": "webp", "level": 90, "lossy": True},
+}
+
+
+def benchmark_filter(frames, options):
+    """
+    Writes frames to an in-memory HDF5 file, returns (stored bytes, encode s, decode s).
+    """
+    with h5py.File("benchmark.h5", "w", driver="core", backing_store=False) as f:
+        start = time.perf_counter()
+        dataset = f.create_dataset(
+            "frames",
+            data=frames,
+            chunks=(1,) + frames.shape[1:],
+            **filter_kwargs(options),
+        )
+        f.flush()
+        encode_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(len(frames)):
+            dataset[i]
+        decode_time = time.perf_counter() - start
+
+        return dataset.id.get_storage_size(), encode_time, decode_time
+
+
+def benchmark_codec(frames, options):
+    """
+    Encodes frames one by one, returns (stored bytes, encode s, decode s).
+    """
+    start = time.perf_counter()
+    buffers = [encode_image(frame, options["codec"], options["level"]) for frame in frames]
+    encode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for buffer in buffers:
+        decode_image(buffer)
+    decode_time = time.perf_counter() - start
+
+    return sum(len(buffer) for buffer in buffers), encode_time, decode_time
+
+
+@click.command()
+@click.option('-f', '--file_path', required=True, multiple=True, help='Absolute path to an episode file, can be repeated.')
+@click.option('-d', '--dataset', default='depth_images', help='Dataset to benchmark.')
+@click.option('-n', '--frames', default=100, help='Max. number of frames per episode.')
+def main(file_path, dataset, frames):
+    samples = []
+    for path in file_path:
+        with h5py.File(path, 'r') as f:
+            samples.append(read_frames(f[dataset], slice(0, frames)))
+    samples = np.concatenate(samples)
+    if samples.ndim == 4 and samples.shape[3] == 4:
+        samples = np.ascontiguousarray(samples[..., :3])  # codecs drop alpha
+
+    raw_bytes = samples.nbytes
+    frame_mb = raw_bytes / len(samples) / 1e6
+    required = frame_mb * RECORDER["frequency"]
+    print(f"{dataset}: {len(samples)} frames {samples.shape[1:]} {samples.dtype}, {frame_mb:.2f} MB per frame")
+    print(f"Sustaining {RECORDER['frequency']} Hz requires {required:.1f} MB/s\n")
+    print(f"{'option':<16}{'ratio':>8}{'encode MB/s':>14}{'decode MB/s':>14}{'sustainable':>14}")
+
+    for name, options in CANDIDATES.items():
+        if options.get("lossy") and not (samples.dtype == np.uint8 and samples.ndim == 4):
+            continue
+        if options.get("compression") in ("lz4", "zstd") and hdf5plugin is None:
+            print(f"{name:<16}  skipped, requires hdf5plugin")
+            continue
+
+        if options.get("codec"):
+            stored_bytes, encode_time, decode_time = benchmark_codec(samples, options)
+        else:
+            stored_bytes, encode_time, decode_time = benchmark_filter(samples, options)
+
+        encode_rate = raw_bytes / encode_time / 1e6
+        decode_rate = raw_bytes / decode_time / 1e6
+        print(
+            f"{name:<16}{raw_bytes / stored_bytes:>8.2f}{encode_rate:>14.1f}{decode_rate:>14.1f}"
+            f"{'yes' if encode_rate > required else 'no':>14}"
+            f"{'  (lossy)' if options.get('lossy') else ''}"
+        )
+
+
+if __name__ == '__main__':
+    main()
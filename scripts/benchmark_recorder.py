@@ -0,0 +1,201 @@
+from src.components.simulated import load_components
+from src.config import RECORDER, REALSENSE, ZED, SIMULATION, GRIPPER
+from src.recorder import read_grip, read_tracker, read_camera, send_to_gripper, record_data
+from src.streams import open_streams, close_streams
+from src.stats import open_stats, close_stats, summarize
+from src.utils import CustomFormatter
+
+import multiprocessing as mp
+import itertools
+import json
+import logging
+import os
+import signal
+import tempfile
+import time
+import h5py
+import numpy as np
+import click
+
+log = logging.getLogger()
+log.setLevel(logging.WARNING)
+console_handler = logging.StreamHandler()
+console_handler.setFormatter(CustomFormatter())
+log.addHandler(console_handler)
+
+
+RESOLUTIONS = {
+    # name: (RealSense width, height, ZED image width, height)
+    "low": (640, 480, 640, 360),
+    "high": (1280, 720, 1280, 720),
+}
+
+STORAGE = {
+    # name: (RECORDER["image_codec"], RECORDER["datasets"])
+    "raw": (None, {}),
+    "jpg": ("jpg", {}),
+    "jpg+zstd": ("jpg", {"depth_images": {"compression": "zstd", "level": 1, "shuffle": True}}),
+    "png": (None, {"depth_images": {"codec": "png", "level": 1}}),
+}
+
+
+def child_pids(pid):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+
+def peak_rss(pid):
+    """
+    Returns the peak resident set size of a process in MB, None if unknown.
+    """
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+
+def analyze_episode(file_path, dt):
+    """
+    Returns the loop timing and stream statistics of a recorded episode.
+    """
+    with h5py.File(file_path, "r") as f:
+        timestamps = f["timestamps"][:].astype(np.int64)
+        periods = np.diff(timestamps) / 1e6  # ms
+        duration = (timestamps[-1] - timestamps[0]) / 1e9 if len(timestamps) > 1 else 0
+
+        # Ticks that recorded the same sample as the previous tick
+        stale = {
+            name: int(np.sum(np.diff(f[name][:].astype(np.int64)) == 0))
+            for name in ("trigger_timestamps", "gripper_timestamps", "image_timestamps", "pose_timestamps")
+        }
+        frame_numbers = f["image_frame_numbers"][:].astype(np.int64)
+        gaps = np.diff(frame_numbers)
+
+        return {
+            "frames": len(timestamps),
+            "duration_s": duration,
+            "period_mean_ms": float(np.mean(periods)),
+            "period_std_ms": float(np.std(periods)),
+            "period_max_error_ms": float(np.max(np.abs(periods - dt * 1e3))),
+            "stale_ticks": stale,
+            "camera_frames_skipped": int(np.sum(gaps[gaps > 1] - 1)),
+        }
+
+
+def run(rate, resolution, storage, duration, directory):
+    """
+    Runs the recorder processes on simulated components for one episode of duration
+    seconds and returns the measurements.
+    """
+    # Settings are inherited by the forked processes
+    color_width, color_height, image_width, image_height = RESOLUTIONS[resolution]
+    REALSENSE.update(
+        color_width=color_width, color_height=color_height,
+        depth_width=color_width, depth_height=color_height,
+    )
+    ZED.update(image_width=image_width, image_height=image_height, image_fps=rate)
+    RECORDER["frequency"] = rate
+    RECORDER["image_codec"], RECORDER["datasets"] = STORAGE[storage]
+    SIMULATION.update(enabled=True, episode=None, speed=1.0, button_period=duration)
+
+    Grip, Tracker, Camera, Gripper = load_components(simulated=True)
+    streams = open_streams(create=True)
+    stats = open_stats(create=True)
+    events = mp.Queue()
+    session_dir = os.path.join(directory, f"{rate}Hz_{resolution}_{storage}")
+
+    processes = {
+        "grip": mp.Process(target=read_grip, args=(Grip, streams["trigger"], stats["grip"])),
+        "tracker": mp.Process(
+            target=read_tracker,
+            args=(Tracker, streams["pose"], streams.get("tracker_image"), stats["tracker"]),
+        ),
+        "camera": mp.Process(target=read_camera, args=(Camera, streams["camera"], stats["camera"])),
+        "gripper": mp.Process(
+            target=send_to_gripper,
+            args=(
+                Gripper, streams["trigger"], streams["gripper"], 1 / GRIPPER["control_frequency"],
+                stats["gripper"],
+            ),
+        ),
+    }
+    recorder = mp.Process(
+        target=record_data, args=(streams, 1 / rate, stats["recorder"], session_dir, events)
+    )
+    for process in processes.values():
+        process.start()
+    recorder.start()
+
+    try:
+        # The simulated button starts recording after duration and stops it after 2 * duration
+        _, file_path, frames, finalize_time = events.get(timeout=3 * duration + 60)
+
+        rss = {name: peak_rss(process.pid) for name, process in processes.items()}
+        rss["recorder"] = peak_rss(recorder.pid)
+        writers = child_pids(recorder.pid)
+        rss["writer"] = max((peak_rss(pid) or 0 for pid in writers), default=None)
+        loops = summarize(stats)
+
+    finally:
+        # The recorder shuts down its writer on SIGINT
+        os.kill(recorder.pid, signal.SIGINT)
+        recorder.join()
+        for process in processes.values():
+            process.terminate()
+            process.join()
+        close_streams(streams)
+        close_stats(stats)
+
+    result = analyze_episode(file_path, 1 / rate)
+    result.update(
+        rate_hz=rate,
+        resolution=resolution,
+        storage=storage,
+        file_mb=os.path.getsize(file_path) / 1e6,
+        write_mb_s=os.path.getsize(file_path) / 1e6 / max(result["duration_s"], 1e-9),
+        finalize_s=finalize_time,
+        peak_rss_mb=rss,
+        loops=loops,
+    )
+    return result
+
+
+@click.command()
+@click.option('-r', '--rates', default='30,60,120', help='Comma-separated recorder frequencies in Hz.')
+@click.option('--resolutions', default='low,high', help=f'Comma-separated resolutions {list(RESOLUTIONS)}.')
+@click.option('-s', '--storage', default='raw,jpg', help=f'Comma-separated storage options {list(STORAGE)}.')
+@click.option('-t', '--duration', default=10.0, help='Length of each recorded episode in seconds.')
+@click.option('-o', '--output', default='recorder_benchmark.json', help='Path of the JSON report.')
+@click.option('-d', '--directory', default=None, help='Directory for the recorded episodes (temporary by default).')
+def main(rates, resolutions, storage, duration, output, directory):
+    rates = [int(rate) for rate in rates.split(',')]
+    resolutions = resolutions.split(',')
+    storage = storage.split(',')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        results = []
+        for rate, resolution, _storage in itertools.product(rates, resolutions, storage):
+            print(f"Recording {duration:.0f} s at {rate} Hz, {resolution} resolution, {_storage} storage...")
+            result = run(rate, resolution, _storage, duration, directory or tmp)
+            results.append(result)
+            print(
+                f"  period {result['period_mean_ms']:.2f} ± {result['period_std_ms']:.2f} ms"
+                f" (max error {result['period_max_error_ms']:.2f} ms)"
+                f" | {result['write_mb_s']:.1f} MB/s | finalize {result['finalize_s']:.2f} s"
+                f" | stale {result['stale_ticks']} | skipped {result['camera_frames_skipped']}"
+                f" | peak RSS {result['peak_rss_mb']}"
+            )
+
+    with open(output, 'w') as f:
+        json.dump({"created": time.time(), "results": results}, f, indent=2)
+    print(f"Report saved as {output}")
+
+
+if __name__ == '__main__':
+    main()
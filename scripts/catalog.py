@@ -0,0 +1,92 @@
+from src.catalog import open_catalog, scan, query, add_tags, remove_tags, update_episode
+from src.utils import CustomFormatter
+
+import logging
+import click
+
+log = logging.getLogger()
+log.setLevel(logging.WARNING)
+console_handler = logging.StreamHandler()
+console_handler.setFormatter(CustomFormatter())
+log.addHandler(console_handler)
+
+
+@click.group()
+@click.option('-c', '--catalog', default=None, help='Path of the catalog, DATA_DIR/catalog.sqlite by default.')
+@click.pass_context
+def main(context, catalog):
+    """
+    Index of the recorded episodes, see src/catalog.py.
+    """
+    context.obj = open_catalog(catalog)
+    context.call_on_close(context.obj.close)
+
+
+@main.command('scan')
+@click.option('-d', '--directory', default=None, help='Directory to index, the catalog directory by default.')
+@click.pass_obj
+def scan_command(connection, directory):
+    """
+    Indexes new and changed episodes, removes deleted ones.
+    """
+    updated, unchanged, removed = scan(connection, directory)
+    print(f"{updated} episodes indexed, {unchanged} unchanged, {removed} removed")
+
+
+@main.command('query')
+@click.option('-t', '--tag', 'tags', multiple=True, help='Required tag, can be repeated.')
+@click.option('-s', '--session', default=None, help='Session name pattern, e.g. "%LAB%".')
+@click.option('--min_duration', default=None, type=float, help='Minimum duration in seconds.')
+@click.option('--max_duration', default=None, type=float, help='Maximum duration in seconds.')
+@click.option('--min_confidence', default=None, type=float, help='Minimum mean pose confidence.')
+@click.option('--min_path_length', default=None, type=float, help='Minimum path length in meters.')
+@click.option('--max_path_length', default=None, type=float, help='Maximum path length in meters.')
+@click.option('-p', '--paths', is_flag=True, help='Only print the file paths.')
+@click.pass_obj
+def query_command(connection, tags, session, min_duration, max_duration, min_confidence, min_path_length, max_path_length, paths):
+    """
+    Lists the episodes matching all conditions.
+    """
+    episodes = query(
+        connection,
+        tags=tags,
+        session=session,
+        min_duration=min_duration,
+        max_duration=max_duration,
+        min_confidence=min_confidence,
+        min_path_length=min_path_length,
+        max_path_length=max_path_length,
+    )
+    for episode in episodes:
+        if paths:
+            print(episode["file_path"])
+            continue
+        confidence = "-" if episode["confidence_mean"] is None else f"{episode['confidence_mean']:.1f}"
+        path_length = "-" if episode["path_length"] is None else f"{episode['path_length']:.2f} m"
+        print(
+            f"{episode['file_path']}  {episode['duration']:.1f} s  {episode['frames']} frames"
+            f"  confidence {confidence}  path {path_length}  [{', '.join(episode['tags'])}]"
+        )
+    if not paths:
+        print(f"{len(episodes)} episodes")
+
+
+@main.command('tag')
+@click.option('-f', '--file_path', required=True, help='Path of the episode file.')
+@click.option('-r', '--remove', is_flag=True, help='Remove the tags instead of adding them.')
+@click.argument('tags', nargs=-1, required=True)
+@click.pass_obj
+def tag_command(connection, file_path, remove, tags):
+    """
+    Adds tags to an episode or removes them.
+    """
+    if remove:
+        remove_tags(connection, file_path, tags)
+    else:
+        if update_episode(connection, file_path) is None:
+            raise click.ClickException(f"{file_path} isn't an episode")
+        add_tags(connection, file_path, tags)
+
+
+if __name__ == '__main__':
+    main()
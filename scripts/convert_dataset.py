@@ -0,0 +1,36 @@
+from src.config import DATASET, DATA_DIR
+from src.dataset import convert_sessions
+from src.utils import CustomFormatter
+
+import logging
+import click
+
+log = logging.getLogger()
+log.setLevel(logging.WARNING)
+console_handler = logging.StreamHandler()
+console_handler.setFormatter(CustomFormatter())
+log.addHandler(console_handler)
+
+
+@click.command()
+@click.option('-d', '--directory', 'directories', multiple=True, help='Session directory or directory of sessions, can be repeated. DATA_DIR by default.')
+@click.option('-o', '--output_dir', default=None, help='Directory of the dataset, "dataset" next to DATA_DIR by default.')
+@click.option('-p', '--processes', default=None, type=int, help='Number of worker processes, all cores by default.')
+@click.option('--size', default=None, help='Size of the image observations as WIDTHxHEIGHT, e.g. 224x224.')
+@click.option('--actions', default=None, type=click.Choice(['relative', 'absolute']), help='Action representation.')
+@click.option('--force', is_flag=True, help='Convert all episodes again.')
+def main(directories, output_dir, processes, size, actions, force):
+    """
+    Converts recorded episodes to a training dataset, only new or changed episodes are converted.
+    """
+    # Settings are inherited by the forked processes
+    if size:
+        DATASET["image_size"] = tuple(int(value) for value in size.lower().split('x'))
+    DATASET["actions"] = actions or DATASET["actions"]
+
+    converted, unchanged, removed = convert_sessions(directories or [DATA_DIR], output_dir, processes, force)
+    print(f"{converted} episodes converted, {unchanged} unchanged, {removed} removed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+from src.components.simulated import load_components
+from src.config import GRIPPER, SIMULATION
+from src.recorder import read_grip, control_gripper
+from src.stats import open_stats, close_stats, summarize, BUCKETS
+from src.streams import open_streams, close_streams
+from src.utils import CustomFormatter
+
+import multiprocessing as mp
+import json
+import logging
+import time
+import click
+
+log = logging.getLogger()
+log.setLevel(logging.WARNING)
+console_handler = logging.StreamHandler()
+console_handler.setFormatter(CustomFormatter())
+log.addHandler(console_handler)
+
+
+def bound_ms(value):
+    """
+    Quantile bound from summarize, None above the last finite bucket bound.
+    """
+    return f"<= {value * 1000:.1f} ms" if value is not None else f"> {BUCKETS[-2] * 1000:.0f} ms"
+
+
+@click.command()
+@click.option('--simulate', is_flag=True, help='Use the simulated grip and gripper instead of the hardware.')
+@click.option('--polling', is_flag=True, help='Poll the trigger stream instead of receiving trigger changes through a pipe.')
+@click.option('--status_frequency', default=None, type=float, help='Status polling rate in Hz, bounds the resolution of the motion latency.')
+@click.option('-t', '--duration', default=20.0, help='Length of the measurement in seconds.')
+@click.option('-o', '--output', default=None, help='Path of a JSON report.')
+def main(simulate, polling, status_frequency, duration, output):
+    """
+    Measures the latency from a trigger sample to the gripper command being sent
+    and from the command to the fingers moving, while the trigger is actuated.
+    """
+    # Settings are inherited by the forked processes
+    SIMULATION["enabled"] = SIMULATION["enabled"] or simulate
+    GRIPPER["asynchronous"] = True
+    GRIPPER["status_frequency"] = status_frequency or GRIPPER["status_frequency"]
+
+    Grip, _, _, Gripper = load_components()
+    streams = open_streams(create=True)
+    stats = open_stats(create=True)
+    trigger_receiver, trigger_sender = (None, None) if polling else mp.Pipe(duplex=False)
+
+    processes = [
+        mp.Process(target=read_grip, args=(Grip, streams["trigger"], stats["grip"], trigger_sender)),
+        mp.Process(
+            target=control_gripper,
+            args=(Gripper, streams["trigger"], streams["gripper"], stats["gripper"], trigger_receiver),
+        ),
+    ]
+    try:
+        for process in processes:
+            process.start()
+        print(f"Measuring for {duration:.0f} s, actuate the trigger...")
+        time.sleep(duration)
+        summary = summarize({"gripper": stats["gripper"]})["gripper"]
+
+    finally:
+        for process in processes:
+            process.terminate()
+            process.join()
+        close_streams(streams)
+        close_stats(stats)
+
+    for histogram in ("trigger_to_command", "command_to_motion"):
+        result = summary[histogram]
+        if not result["count"]:
+            print(f"{histogram}: no samples")
+            continue
+        print(
+            f"{histogram}: {result['count']} samples, mean {result['mean'] * 1000:.1f} ms,"
+            f" p50 {bound_ms(result['p50'])}, p99 {bound_ms(result['p99'])}"
+        )
+    print(f"Motion is detected by status polls every {1000 / GRIPPER['status_frequency']:.0f} ms")
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(
+                {"created": time.time(), "polling": polling, "status_frequency": GRIPPER["status_frequency"], "latency": summary},
+                f,
+                indent=2,
+            )
+        print(f"Report saved as {output}")
+
+
+if __name__ == '__main__':
+    main()
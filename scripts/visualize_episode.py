@@ -4,8 +4,10 @@ import click
 
 @click.command()
 @click.option('-f', '--file_path', required=False, help='Absolute path to the episode file.')
-def main(file_path):
-    visualize_episode(file_path)
+@click.option('-s', '--start', default=None, type=float, help='Start of the rendered part in seconds since the first frame.')
+@click.option('-e', '--end', default=None, type=float, help='End of the rendered part in seconds since the first frame.')
+def main(file_path, start, end):
+    visualize_episode(file_path, start, end)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -1,17 +1,14 @@
-from src.visualizer import visualize_episode
+from src.visualizer import visualize_session
 import click
-import os
 
 
 @click.command()
 @click.option('-d', '--directory', required=True, help='Absolute path to the session directory')
-def main(directory):
-    files = os.listdir(directory)
-    for file in files:
-        file_path = os.path.join(directory, file)
-        if os.path.isfile(file_path) and file.endswith('.h5'):
-            visualize_episode(file_path)
+@click.option('-p', '--processes', default=None, type=int, help='Number of worker processes, all cores by default.')
+@click.option('-s', '--segment_seconds', default=None, type=float, help='Render episodes in parts of this length in parallel.')
+def main(directory, processes, segment_seconds):
+    visualize_session(directory, processes, segment_seconds)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,305 @@
+"""
+SQLite index of the recorded episodes, so that episodes can be found by their
+summary (duration, pose confidence, path length, tags) without opening every file.
+
+Paths are stored relative to the directory of the catalog, the catalog can be moved
+together with the data. Episodes are only summarized again if the size or the
+modification time of their file changed.
+"""
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+import h5py
+import numpy as np
+
+from src.config import CATALOG, DATA_DIR
+from src.episode import EpisodeReader
+
+log = logging.getLogger(__name__)
+
+# Files without these datasets (e.g. converted datasets) aren't indexed
+EPISODE_DATASETS = ("timestamps", "pose_values")
+DATASET_MANIFEST = "manifest.json"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS episodes (
+    path TEXT PRIMARY KEY,
+    session TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    started REAL,
+    duration REAL,
+    frames INTEGER,
+    datasets TEXT,
+    confidence_mean REAL,
+    confidence_min REAL,
+    confidence_max REAL,
+    confidence_std REAL,
+    path_length REAL,
+    indexed REAL
+);
+CREATE TABLE IF NOT EXISTS tags (
+    path TEXT REFERENCES episodes(path) ON DELETE CASCADE,
+    tag TEXT,
+    source TEXT,
+    PRIMARY KEY (path, tag)
+);
+CREATE INDEX IF NOT EXISTS tags_tag ON tags (tag);
+CREATE INDEX IF NOT EXISTS episodes_session ON episodes (session);
+"""
+
+
+def catalog_path():
+    return CATALOG["path"] or os.path.join(DATA_DIR, "catalog.sqlite")
+
+
+def open_catalog(path=None):
+    """
+    Opens the catalog, creating it if it doesn't exist. Rows are returned as sqlite3.Row.
+    """
+    path = path or catalog_path()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    connection = sqlite3.connect(path, timeout=10)
+    connection.row_factory = sqlite3.Row
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA foreign_keys=ON")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def _root(connection):
+    database = connection.execute("PRAGMA database_list").fetchone()["file"]
+    return os.path.dirname(database)
+
+
+def _key(connection, file_path):
+    return os.path.relpath(os.path.abspath(file_path), _root(connection))
+
+
+def session_tags(file_path):
+    """
+    Tags from the name of the session directory after its timestamp, e.g.
+    session_20240626_124925_LAB_with_tracking -> ["lab", "with", "tracking"].
+    """
+    session = os.path.basename(os.path.dirname(os.path.abspath(file_path)))
+    suffix = re.sub(r"^session_\d{8}_\d{6}_?", "", session)
+    return [tag for tag in suffix.lower().split("_") if tag]
+
+
+def summarize_episode(file_path):
+    """
+    Returns the catalog columns of an episode, or None if the file isn't one. Only
+    timestamps, poses and confidences are read, images stay on disk.
+    """
+    with h5py.File(file_path, "r") as f:
+        if not all(name in f for name in EPISODE_DATASETS):
+            return None
+    with EpisodeReader(file_path) as episode:
+        timestamps = episode.timestamps
+        datasets = {}
+        for name in episode.keys():
+            dataset = episode.file[name]
+            if not isinstance(dataset, h5py.Dataset):
+                continue
+            datasets[name] = {"shape": list(dataset.shape), "dtype": str(dataset.dtype)}
+            if "codec" in dataset.attrs:
+                datasets[name]["codec"] = str(dataset.attrs["codec"])
+
+        summary = {
+            "session": os.path.basename(os.path.dirname(os.path.abspath(file_path))),
+            "started": float(timestamps[0]) / 1e9 if len(timestamps) else None,
+            "duration": episode.duration,
+            "frames": len(episode),
+            "datasets": json.dumps(datasets),
+            "confidence_mean": None,
+            "confidence_min": None,
+            "confidence_max": None,
+            "confidence_std": None,
+            "path_length": None,
+        }
+
+        if "pose_confidences" in episode and len(episode):
+            confidences = episode["pose_confidences"].read().astype(np.float64)
+            summary.update(
+                confidence_mean=float(confidences.mean()),
+                confidence_min=float(confidences.min()),
+                confidence_max=float(confidences.max()),
+                confidence_std=float(confidences.std()),
+            )
+        if "pose_values" in episode and len(episode):
+            translations = episode["pose_values"].read()[:, :3, 3]
+            steps = np.linalg.norm(np.diff(translations, axis=0), axis=1)
+            summary["path_length"] = float(np.nansum(steps))
+
+    return summary
+
+
+def update_episode(connection, file_path, tags=(), force=False):
+    """
+    Adds or refreshes the entry of an episode. Returns False if it was up to date
+    and None if the file isn't an episode.
+    """
+    key = _key(connection, file_path)
+    stat = os.stat(file_path)
+    row = connection.execute(
+        "SELECT size, mtime_ns FROM episodes WHERE path = ?", (key,)
+    ).fetchone()
+    if row and not force and (row["size"], row["mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+        if tags:
+            add_tags(connection, file_path, tags)
+        return False
+
+    summary = summarize_episode(file_path)
+    if summary is None:
+        log.debug(f"Skipped {file_path}, not an episode")
+        return None
+    summary.update(path=key, size=stat.st_size, mtime_ns=stat.st_mtime_ns, indexed=time.time())
+    columns = ", ".join(summary)
+    placeholders = ", ".join(f":{column}" for column in summary)
+    updates = ", ".join(f"{column} = excluded.{column}" for column in summary if column != "path")
+    with connection:
+        # An upsert keeps the tags, INSERT OR REPLACE would delete them with the old row
+        connection.execute(
+            f"INSERT INTO episodes ({columns}) VALUES ({placeholders}) "
+            f"ON CONFLICT (path) DO UPDATE SET {updates}",
+            summary,
+        )
+        connection.execute("DELETE FROM tags WHERE path = ? AND source = 'session'", (key,))
+        connection.executemany(
+            "INSERT OR IGNORE INTO tags (path, tag, source) VALUES (?, ?, 'session')",
+            [(key, tag) for tag in session_tags(file_path)],
+        )
+    if tags:
+        add_tags(connection, file_path, tags)
+    log.debug(f"Indexed {file_path}")
+    return True
+
+
+def add_tags(connection, file_path, tags):
+    key = _key(connection, file_path)
+    with connection:
+        connection.executemany(
+            "INSERT OR IGNORE INTO tags (path, tag, source) VALUES (?, ?, 'user')",
+            [(key, tag.lower()) for tag in tags],
+        )
+
+
+def remove_tags(connection, file_path, tags):
+    key = _key(connection, file_path)
+    with connection:
+        connection.executemany(
+            "DELETE FROM tags WHERE path = ? AND tag = ?", [(key, tag.lower()) for tag in tags]
+        )
+
+
+def scan(connection, directory=None):
+    """
+    Indexes new and changed episodes below directory (the catalog directory by default)
+    and removes entries of deleted ones. Directories of converted datasets are skipped.
+    Returns (updated, unchanged, removed) counts.
+    """
+    directory = os.path.abspath(directory or _root(connection))
+    updated = unchanged = 0
+    found = set()
+    for root, directories, files in os.walk(directory):
+        if DATASET_MANIFEST in files:
+            # A converted dataset (see src/dataset.py), its files aren't episodes
+            directories[:] = []
+            continue
+        for file in sorted(files):
+            if not file.endswith(".h5"):
+                continue
+            file_path = os.path.join(root, file)
+            try:
+                result = update_episode(connection, file_path)
+            except Exception as e:
+                # Keep the entry of a file that can't be read right now, e.g. while it's written
+                log.warning(f"Could not index {file_path}: {e}")
+                found.add(_key(connection, file_path))
+                continue
+            if result is None:
+                continue
+            found.add(_key(connection, file_path))
+            if result:
+                updated += 1
+            else:
+                unchanged += 1
+
+    prefix = _key(connection, directory)
+    removed = [
+        row["path"]
+        for row in connection.execute("SELECT path FROM episodes")
+        if row["path"] not in found and _is_below(row["path"], prefix)
+    ]
+    with connection:
+        connection.executemany("DELETE FROM episodes WHERE path = ?", [(path,) for path in removed])
+    return updated, unchanged, len(removed)
+
+
+def in_catalog(file_path, path=None):
+    """
+    Whether file_path is below the directory of the catalog at path.
+    """
+    root = os.path.dirname(os.path.abspath(path or catalog_path()))
+    return _is_below(os.path.relpath(os.path.abspath(file_path), root), ".")
+
+
+def _is_below(path, prefix):
+    if path.startswith(".." + os.sep) or os.path.isabs(path):
+        return False
+    return prefix == "." or path == prefix or path.startswith(prefix + os.sep)
+
+
+def query(
+    connection,
+    tags=(),
+    session=None,
+    min_duration=None,
+    max_duration=None,
+    min_confidence=None,
+    min_path_length=None,
+    max_path_length=None,
+):
+    """
+    Returns the episodes matching all given conditions as dicts, oldest first,
+    with "file_path" (absolute) and "tags". session is a SQL LIKE pattern, e.g. "%LAB%".
+
+        query(connection, tags=["kitchen"], min_duration=10, min_confidence=80)
+    """
+    conditions = []
+    parameters = []
+    for column, operator, value in (
+        ("duration", ">=", min_duration),
+        ("duration", "<=", max_duration),
+        ("confidence_mean", ">=", min_confidence),
+        ("path_length", ">=", min_path_length),
+        ("path_length", "<=", max_path_length),
+        ("session", "LIKE", session),
+    ):
+        if value is not None:
+            conditions.append(f"{column} {operator} ?")
+            parameters.append(value)
+    for tag in tags:
+        conditions.append("path IN (SELECT path FROM tags WHERE tag = ?)")
+        parameters.append(tag.lower())
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    rows = connection.execute(
+        f"SELECT * FROM episodes {where} ORDER BY started", parameters
+    ).fetchall()
+
+    root = _root(connection)
+    episodes = []
+    for row in rows:
+        episode = dict(row)
+        episode["file_path"] = os.path.normpath(os.path.join(root, row["path"]))
+        episode["datasets"] = json.loads(row["datasets"])
+        episode["tags"] = [
+            tag["tag"]
+            for tag in connection.execute("SELECT tag FROM tags WHERE path = ? ORDER BY tag", (row["path"],))
+        ]
+        episodes.append(episode)
+    return episodes
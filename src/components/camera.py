@@ -7,7 +7,7 @@ from src.config import REALSENSE
 log = logging.getLogger(__name__)
 
 class Camera:
-  def __init__(self):
+  def __init__(self, queue_capacity=REALSENSE["queue_capacity"]):
     try:
       log.info('Opening RealSense camera stream')
       
@@ -15,20 +15,54 @@ class Camera:
       config = rs.config()
       config.enable_stream(rs.stream.color, REALSENSE["color_width"], REALSENSE["color_height"], rs.format.bgr8, REALSENSE["color_fps"])
       config.enable_stream(rs.stream.depth, REALSENSE["depth_width"], REALSENSE["depth_height"], rs.format.z16, REALSENSE["depth_fps"])
-      self.pipeline.start(config)
+
+      # Framesets are delivered into a bounded queue, the oldest are dropped when it's full
+      self.queue = rs.frame_queue(queue_capacity, keep_frames=True)
+      self.pipeline.start(config, self.queue)
       
       self.frames = None
+      self.frame_number = None  # hardware frame number of the latest frameset
+      self.dropped_frames = 0  # total number of frames missing between framesets
       
     except Exception as e:
       raise Exception('Error opening RealSense camera stream: ' + str(e))
 
-  def wait_for_frames(self):
-    self.frames = self.pipeline.wait_for_frames()
+  def wait_for_frames(self, timeout_ms=REALSENSE["timeout_ms"]):
+    '''
+    Waits for the next frameset. Returns False if none arrived within timeout_ms.
+    '''
+    success, frame = self.queue.try_wait_for_frame(timeout_ms)
+    if not success:
+      return False
+
+    self.frames = frame.as_frameset()
+
+    frame_number = self.frames.get_frame_number()
+    if self.frame_number is not None and frame_number > self.frame_number + 1:
+      dropped = frame_number - self.frame_number - 1
+      self.dropped_frames += dropped
+      log.debug(f'Dropped {dropped} frames ({self.dropped_frames} in total)')
+    self.frame_number = frame_number
+
+    return True
+
+  def get_timestamp(self):
+    '''
+    Returns the sensor timestamp of the latest frameset in nanoseconds.
+    With global time enabled (default) it is in the host's time.time_ns() domain.
+    '''
+    try:
+      return int(self.frames.get_timestamp() * 1e6)
+    except AttributeError:
+      raise Exception('Did you call wait_for_frames before get_timestamp?')
 
+  def get_frame_number(self):
+    return self.frame_number
 
   def get_image(self):
     '''
     Returns 8-bit blue, green, and red channels channels - suitable for OpenCV
+    The array is a view of the frame's memory, no copy is made.
     '''
     try:
       return np.asanyarray(self.frames.get_color_frame().get_data())
@@ -41,6 +75,7 @@ class Camera:
   def get_depth(self):
     '''
     Returns 16 bit linear depth values. The depth is meters is equal to depth scale * pixel value.
+    The array is a view of the frame's memory, no copy is made.
     '''
     try:
       return np.asanyarray(self.frames.get_depth_frame().get_data())
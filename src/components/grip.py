@@ -1,11 +1,70 @@
+import binascii
 import logging
 import serial
 import serial.tools.list_ports
+import struct
 import time
 from numpy import interp
 
+from src.config import GRIP
+
 log = logging.getLogger(__name__)
 
+# Packet sent by arduino_interface.ino, little-endian:
+# sync | sequence uint16 | micros uint32 | trigger uint8 | button uint8 | CRC-16/XMODEM uint16
+SYNC = b"\xaa\x55"
+PACKET = struct.Struct("<2sHIBBH")
+
+
+class PacketParser:
+    """
+    Incremental parser of the binary packet stream. Bytes can be fed in chunks of
+    any size, partial packets are kept until the rest arrives and the parser
+    resynchronizes on the sync bytes after corrupt data.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.sequence = None
+        self.packets = 0  # valid packets
+        self.lost = 0  # packets missing in the sequence, including corrupt ones
+        self.corrupt = 0  # packets with a wrong CRC
+
+    def feed(self, data):
+        """
+        Parses all complete packets in data, returns the newest valid one as
+        (sequence, micros, trigger, button) or None.
+        """
+        self.buffer += data
+        newest = None
+        position = 0
+
+        while True:
+            position = self.buffer.find(SYNC, position)
+            if position < 0:
+                # Keep a trailing first sync byte
+                position = len(self.buffer) - 1 if self.buffer.endswith(SYNC[:1]) else len(self.buffer)
+                break
+            if len(self.buffer) - position < PACKET.size:
+                break
+
+            _, sequence, micros, trigger, button, crc = PACKET.unpack_from(self.buffer, position)
+            payload = self.buffer[position + len(SYNC):position + PACKET.size - 2]
+            if binascii.crc_hqx(payload, 0) != crc:
+                self.corrupt += 1
+                position += 1
+                continue
+
+            if self.sequence is not None:
+                self.lost += (sequence - self.sequence - 1) % 0x10000
+            self.sequence = sequence
+            self.packets += 1
+            newest = sequence, micros, trigger, button
+            position += PACKET.size
+
+        del self.buffer[:position]
+        return newest
+
 
 class Grip:
     """
@@ -17,6 +76,8 @@ class Grip:
     def __init__(self, comport=None, description="FT232R USB UART"):
         self.trigger_state = 0  # int [0,100]
         self.button_state = 0  # int {0,1}
+        self.device_timestamp = 0  # int, microseconds since the Arduino started (wraps after ~71 min)
+        self.parser = PacketParser()
 
         self.open_serial(comport, description)
         # input("### Please actuate the full range of the trigger and confirm ###")
@@ -27,24 +88,31 @@ class Grip:
     def get_button_state(self):
         return self.button_state
 
+    @property
+    def lost_packets(self):
+        """
+        Number of packets missing in the sequence, lost or corrupted in transmission.
+        """
+        return self.parser.lost
+
     def get_data(self):
         '''
-        Returns timestamp if new data is received, otherwise None
+        Returns timestamp if new data is received, otherwise None.
+        Drains all received bytes and keeps only the newest sample.
         '''
-        line = self.read_serial()
+        data = self.read_serial()
+        timestamp = time.time_ns()
+        if not data:
+            return None
 
-        try:
-            trigger_state, button_state = line.split(",")
-            self.trigger_state = int(trigger_state)
-            self.button_state = int(button_state)
-            return time.time_ns()
+        packet = self.parser.feed(data)
+        if packet is None:
+            return None
 
-        except ValueError as e:
-            log.warn(f"False value received: {line}")
-        except TypeError as e:
-            log.warn(f"Non-integer type received: {type(line)}")
+        _, self.device_timestamp, self.trigger_state, self.button_state = packet
+        return timestamp
 
-    def open_serial(self, comport, description, baudrate=115200):
+    def open_serial(self, comport, description, baudrate=GRIP["baudrate"]):
         if comport == None:
             log.info(f"Scanning comports for {description}")
             ports = serial.tools.list_ports.comports()
@@ -64,14 +132,14 @@ class Grip:
 
         if comport:
             try:
-                self.ser = serial.Serial(comport, baudrate, timeout=1)
+                self.ser = serial.Serial(comport, baudrate, timeout=GRIP["read_timeout"])
                 log.info(f"Connected to {description} at {comport}")
                 self.ser.reset_input_buffer()
                 time.sleep(1)
                 if self.ser.in_waiting > 0:
-                    log.info(f"Reading initial lines to clear buffer")
-                    for i in range(10):
-                        _ = self.ser.readline()
+                    # The parser resynchronizes on the next packet
+                    log.info(f"Clearing buffer")
+                    self.ser.reset_input_buffer()
                 else:
                     log.error(f"No bytes received from Arduino... ABORTING")
                     raise SystemExit
@@ -89,11 +157,12 @@ class Grip:
             raise Exception(f"No comport defined for {description}")
 
     def read_serial(self):
+        """
+        Returns all bytes waiting, blocks up to GRIP["read_timeout"] for the first one.
+        """
         try:
-            line = self.ser.readline().decode().rstrip()
-            log.debug("Serial read line: " + line)
-            return line
-        except UnicodeDecodeError as e:
+            return self.ser.read(self.ser.in_waiting or 1)
+        except serial.SerialException as e:
             log.error(e)
 
     def close_serial(self):
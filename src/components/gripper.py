@@ -2,7 +2,8 @@ import logging
 import time
 import serial
 import serial.tools.list_ports
-from src.components.third_party.robotiq_2finger_gripper import Robotiq2FingerGripper
+import asyncio
+from src.components.third_party.robotiq_2finger_gripper import AsyncCommunication, Robotiq2FingerGripper
 
 log = logging.getLogger(__name__)
 
@@ -24,6 +25,9 @@ class Gripper:
             raise SystemExit
             #raise Exception(f"Failed to contact gripper on port {comport}... ABORTING")
         
+        # Last command sent, identical commands are not sent again
+        self.last_command = None
+
         log.info(f'Connected to {description} at {comport}')
 
     def go_to(self, position):
@@ -31,7 +35,26 @@ class Gripper:
         Go to position: 0=OPEN 100=CLOSED
         '''
         self.gripper.goto(pos=position/100, vel=1.0, force=1.0)
-        self.gripper.sendCommand()
+        if self.gripper.message == self.last_command:
+            return True
+        if self.gripper.sendCommand():
+            self.last_command = list(self.gripper.message)
+            return True
+        self.last_command = None
+        return False
+
+    def go_to_and_get_state(self, position):
+        '''
+        Go to position and return the state (like get_state) with a single
+        read/write transaction. Only reads the state if the command is unchanged.
+        '''
+        self.gripper.goto(pos=position/100, vel=1.0, force=1.0)
+        if self.gripper.message == self.last_command:
+            return self.get_state()
+        if self.gripper.sendCommandGetStatus():
+            self.last_command = list(self.gripper.message)
+            return self.gripper.get_pos()*100
+        self.last_command = None
 
 
     def get_state(self):
@@ -49,6 +72,7 @@ class Gripper:
         self.gripper.activate_gripper()
         self.gripper.sendCommand()
         time.sleep(2)
+        self.last_command = None
         if (
             self.gripper.is_ready()
             and self.gripper.sendCommand()
@@ -59,7 +83,8 @@ class Gripper:
             raise Exception(f"Unable to activate gripper")
 
 
-    def find_comport(self, description):
+    @staticmethod
+    def find_comport(description):
         comport = None
         log.info(f'Scanning comports for {description}')
         ports = serial.tools.list_ports.comports()
@@ -74,4 +99,75 @@ class Gripper:
         else:
             log.info(f'Comport specified as {comport}')
 
-        return comport
\ No newline at end of file
+        return comport
+
+
+class AsyncGripper:
+    '''
+    Gripper on the asyncio Modbus client, so that commands and status reads can be
+    issued independently. The coroutines have to run on self.loop.
+    '''
+    def __init__(self, comport=None, description='USB TO RS-485'):
+        if not comport:
+            comport = Gripper.find_comport(description)
+
+        self.communication = AsyncCommunication()
+        self.gripper = Robotiq2FingerGripper(comport=comport, client=self.communication)
+        self.loop = self.communication.loop
+
+        if not self.loop.run_until_complete(self._get_status()):
+            log.error(f"Failed to contact gripper on port {comport}... ABORTING")
+            raise SystemExit
+
+        # Last command sent, identical commands are not sent again
+        self.last_command = None
+
+        log.info(f'Connected to {description} at {comport}')
+
+    async def _get_status(self):
+        return self.gripper._parseStatus(await self.communication.getStatus(6))
+
+    async def _send_command(self):
+        return await self.communication.sendCommand(self.gripper.message)
+
+    async def go_to(self, position):
+        '''
+        Go to position: 0=OPEN 100=CLOSED
+        Returns True if the command was sent, False if sending failed and None if it
+        wasn't sent because it equals the last command.
+        '''
+        self.gripper.goto(pos=position/100, vel=1.0, force=1.0)
+        if self.gripper.message == self.last_command:
+            return None
+        command = list(self.gripper.message)
+        if await self._send_command():
+            self.last_command = command
+            return True
+        self.last_command = None
+        return False
+
+    async def get_state(self):
+        if await self._get_status():
+            return self.gripper.get_pos()*100
+
+    async def activate(self):
+        self.gripper.activate_emergency_release()
+        await self._send_command()
+        await asyncio.sleep(1)
+        self.gripper.deactivate_emergency_release()
+        await self._send_command()
+        await asyncio.sleep(1)
+        self.gripper.activate_gripper()
+        await self._send_command()
+        await asyncio.sleep(2)
+        self.last_command = None
+        if (
+            await self._get_status()
+            and self.gripper.is_ready()
+        ):
+            log.info(f'Gripper activated')
+        else:
+            raise Exception(f"Unable to activate gripper")
+
+    def close(self):
+        self.communication.disconnectFromDevice()
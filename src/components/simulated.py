@@ -0,0 +1,353 @@
+import asyncio
+import logging
+import time
+import cv2
+import h5py
+import numpy as np
+
+from src.config import SIMULATION, REALSENSE, ZED, GRIPPER
+from src.episode import read_frames
+
+log = logging.getLogger(__name__)
+
+
+def load_components(simulated=None):
+    """
+    Returns the component classes (Grip, Tracker, Camera, Gripper), simulated ones if
+    simulated or SIMULATION["enabled"]. The hardware SDKs are only imported for the real ones.
+    Gripper is the asyncio variant if GRIPPER["asynchronous"].
+    """
+    if simulated or (simulated is None and SIMULATION["enabled"]):
+        Gripper = SimulatedAsyncGripper if GRIPPER["asynchronous"] else SimulatedGripper
+        return SimulatedGrip, SimulatedTracker, SimulatedCamera, Gripper
+
+    from src.components.grip import Grip
+    from src.components.tracker import Tracker
+    from src.components.camera import Camera
+    from src.components.gripper import Gripper, AsyncGripper
+
+    return Grip, Tracker, Camera, AsyncGripper if GRIPPER["asynchronous"] else Gripper
+
+
+class Clock:
+    """
+    Paces a simulated device at its sample rate, scaled by SIMULATION["speed"].
+    The time of the simulation starts at 0 when the clock is created.
+    """
+
+    def __init__(self, frequency, speed=None, jitter=None):
+        speed = speed or SIMULATION["speed"]
+        jitter = SIMULATION["jitter"] if jitter is None else jitter
+        self.period = 1 / (frequency * speed)
+        self.speed = speed
+        self.jitter = jitter
+        self.start = time.perf_counter()
+        self.deadline = self.start
+        self.rng = np.random.default_rng()
+
+    def now(self):
+        """
+        Returns the simulated time in seconds.
+        """
+        return (time.perf_counter() - self.start) * self.speed
+
+    def wait(self):
+        """
+        Blocks until the next sample is due, like a device delivering at its rate.
+        """
+        self.deadline += self.period
+        delay = self.deadline - time.perf_counter()
+        if self.jitter:
+            delay += abs(self.rng.normal(0, self.jitter))
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -self.period:
+            self.deadline = time.perf_counter()  # fell behind, don't try to catch up
+
+
+class EpisodeReplay:
+    """
+    Sample-and-hold access to the datasets of a recorded episode by simulated time.
+    The episode is looped.
+    """
+
+    def __init__(self, file_path=None):
+        file_path = file_path or SIMULATION["episode"]
+        self.file = h5py.File(file_path, "r")
+        timestamps = self.file["timestamps"][:].astype(np.float64)
+        self.times = (timestamps - timestamps[0]) / 1e9
+        period = np.median(np.diff(self.times)) if len(self.times) > 1 else 1 / 30
+        self.duration = self.times[-1] + period
+        log.info(f"Replaying {file_path} ({len(self.times)} frames, {self.duration:.1f} s)")
+
+    def index(self, t):
+        return int(np.searchsorted(self.times, t % self.duration, side="right") - 1)
+
+    def read(self, name, t):
+        return read_frames(self.file[name], self.index(t))
+
+    def __contains__(self, name):
+        return name in self.file
+
+
+def _resize(image, width, height):
+    if image.shape[1] != width or image.shape[0] != height:
+        image = cv2.resize(image, (width, height), interpolation=cv2.INTER_NEAREST)
+    return image
+
+
+def _synthetic_images(width, height, count=30):
+    """
+    Moving color gradients, precomputed so generating frames costs nothing.
+    """
+    y, x = np.mgrid[0:height, 0:width]
+    images = []
+    for i in range(count):
+        phase = 2 * np.pi * i / count
+        image = np.stack(
+            [
+                127 + 127 * np.sin(x / width * 2 * np.pi + phase),
+                127 + 127 * np.sin(y / height * 2 * np.pi + phase),
+                np.full_like(x, 255 * i / count, dtype=np.float64),
+            ],
+            axis=-1,
+        )
+        images.append(image.astype(np.uint8))
+    return images
+
+
+class SimulatedGrip:
+    """
+    Drop-in for Grip. The trigger follows the recorded trigger_states or a sine wave,
+    the button is pressed every SIMULATION["button_period"] seconds.
+    """
+
+    frequency = 100  # Hz, as sent by the Arduino
+
+    def __init__(self, comport=None, description=None):
+        self.trigger_state = 0
+        self.button_state = 0
+        self.device_timestamp = 0
+        self.lost_packets = 0
+        self.clock = Clock(self.frequency)
+        self.replay = EpisodeReplay() if SIMULATION["episode"] else None
+        log.info("Connected to simulated grip")
+
+    def get_trigger_state(self):
+        return self.trigger_state
+
+    def get_button_state(self):
+        return self.button_state
+
+    def get_data(self):
+        self.clock.wait()
+        t = self.clock.now()
+
+        if self.replay:
+            self.trigger_state = int(self.replay.read("trigger_states", t))
+        else:
+            self.trigger_state = int(50 + 50 * np.sin(2 * np.pi * t / 4))
+
+        period = SIMULATION["button_period"]
+        self.button_state = int(period is not None and t >= period and t % period < 0.2)
+        self.device_timestamp = int(t * 1e6) % 2**32
+
+        return time.time_ns()
+
+    def close_serial(self):
+        log.info("Connection closed")
+
+
+class SimulatedTracker:
+    """
+    Drop-in for Tracker. Replays recorded poses and tracker images or moves on a circle.
+    """
+
+    def __init__(self, fps=ZED["fps"]):
+        self.fps = fps
+        self.clock = Clock(fps)  # poses and images are delivered at fps
+        self.replay = EpisodeReplay() if SIMULATION["episode"] else None
+        self.images = [
+            cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)
+            for image in _synthetic_images(ZED["image_width"], ZED["image_height"])
+        ]
+        self.time = 0
+        log.info("Simulated tracker opened")
+
+    def enable_tracking(self):
+        log.info("Enabling positional tracking")
+
+    def grab_frame(self):
+        self.clock.wait()
+        self.time = self.clock.now()
+        return True
+
+    def get_image(self, deep_copy=True):
+        if self.replay and "tracker_images" in self.replay:
+            image = self.replay.read("tracker_images", self.time)
+            image = _resize(image, ZED["image_width"], ZED["image_height"])
+        else:
+            image = self.images[int(self.time * self.fps) % len(self.images)]
+
+        if image.shape[2] == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2BGRA)  # the ZED delivers BGRA
+        return int(time.time() * 1000), image.copy() if deep_copy else image
+
+    def get_ee_pose(self):
+        return self.get_pose()
+
+    def get_pose_in_ee_frame(self):
+        return self.get_pose()
+
+    def get_pose(self):
+        if self.replay:
+            pose = self.replay.read("pose_values", self.time)
+            confidence = int(self.replay.read("pose_confidences", self.time))
+        else:
+            angle = 2 * np.pi * self.time / 8
+            pose = np.eye(4)
+            pose[:3, :3] = [
+                [np.cos(angle), -np.sin(angle), 0],
+                [np.sin(angle), np.cos(angle), 0],
+                [0, 0, 1],
+            ]
+            pose[:3, 3] = [0.2 * np.cos(angle), 0.2 * np.sin(angle), 0.05 * np.sin(2 * angle)]
+            confidence = 100
+
+        return int(time.time() * 1000), confidence, pose
+
+    def close(self):
+        log.info("Camera closed")
+
+
+class SimulatedCamera:
+    """
+    Drop-in for Camera. Replays recorded color and depth images or moving gradients.
+    """
+
+    def __init__(self, queue_capacity=None):
+        self.clock = Clock(REALSENSE["color_fps"])
+        self.replay = EpisodeReplay() if SIMULATION["episode"] else None
+        self.images = _synthetic_images(REALSENSE["color_width"], REALSENSE["color_height"])
+        self.depths = [
+            (image[:, :, 0].astype(np.uint16) * 20 + 1000)
+            for image in _synthetic_images(REALSENSE["depth_width"], REALSENSE["depth_height"])
+        ]
+        self.frame_number = 0
+        self.dropped_frames = 0
+        self.timestamp = 0
+        self.time = 0
+        log.info("Opening simulated RealSense camera stream")
+
+    def wait_for_frames(self, timeout_ms=None):
+        self.clock.wait()
+        self.time = self.clock.now()
+        self.timestamp = time.time_ns()
+        self.frame_number += 1
+        return True
+
+    def get_timestamp(self):
+        return self.timestamp
+
+    def get_frame_number(self):
+        return self.frame_number
+
+    def get_image(self):
+        if self.replay:
+            image = self.replay.read("color_images", self.time)
+            return _resize(image, REALSENSE["color_width"], REALSENSE["color_height"])
+        return self.images[self.frame_number % len(self.images)]
+
+    def get_depth(self):
+        if self.replay:
+            depth = self.replay.read("depth_images", self.time)
+            return _resize(depth, REALSENSE["depth_width"], REALSENSE["depth_height"])
+        return self.depths[self.frame_number % len(self.depths)]
+
+
+class SimulatedGripper:
+    """
+    Drop-in for Gripper. The fingers move towards the commanded position at a finite
+    speed, every transaction takes SIMULATION["bus_latency"] like a Modbus round trip.
+    """
+
+    speed = 150  # %/s, full stroke in about 0.7 s
+
+    def __init__(self, comport=None, description=None):
+        self.position = 0.0
+        self.target = 0.0
+        self.last_command = None
+        self.last_update = time.perf_counter()
+        log.info("Connected to simulated gripper")
+
+    def _update(self):
+        now = time.perf_counter()
+        step = self.speed * SIMULATION["speed"] * (now - self.last_update)
+        self.position += np.clip(self.target - self.position, -step, step)
+        self.last_update = now
+
+    def _transaction(self):
+        time.sleep(SIMULATION["bus_latency"])
+        self._update()
+
+    def go_to(self, position):
+        """
+        Go to position: 0=OPEN 100=CLOSED
+        """
+        if position == self.last_command:
+            return True
+        self._transaction()
+        self.target = float(np.clip(position, 0, 100))
+        self.last_command = position
+        return True
+
+    def go_to_and_get_state(self, position):
+        if position == self.last_command:
+            return self.get_state()
+        self._transaction()
+        self.target = float(np.clip(position, 0, 100))
+        self.last_command = position
+        return self.position
+
+    def get_state(self):
+        self._transaction()
+        return self.position
+
+    def activate(self):
+        log.info("Gripper activated")
+
+
+class SimulatedAsyncGripper(SimulatedGripper):
+    """
+    Drop-in for AsyncGripper, transactions are serialized like on the RS-485 bus.
+    """
+
+    def __init__(self, comport=None, description=None):
+        super().__init__(comport, description)
+        self.loop = asyncio.new_event_loop()
+        self.lock = None
+
+    async def _transaction(self):
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            await asyncio.sleep(SIMULATION["bus_latency"])
+            self._update()
+
+    async def go_to(self, position):
+        if position == self.last_command:
+            return None  # like AsyncGripper, unchanged commands aren't sent
+        self.last_command = position
+        await self._transaction()
+        self.target = float(np.clip(position, 0, 100))
+        return True
+
+    async def get_state(self):
+        await self._transaction()
+        return self.position
+
+    async def activate(self):
+        log.info("Gripper activated")
+
+    def close(self):
+        self.loop.close()
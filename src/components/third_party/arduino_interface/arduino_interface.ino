@@ -3,26 +3,55 @@ const int greenLEDPin = 3;
 const int buttonPin = 13;
 const int potPin = A7;
 
+// Binary packet, little-endian (see src/components/grip.py):
+// sync 0xAA 0x55 | sequence uint16 | micros uint32 | trigger uint8 | button uint8 | CRC-16/XMODEM uint16
+// The CRC covers the bytes from sequence to button. At 115200 baud up to ~900 packets/s fit.
+const byte SYNC[2] = {0xAA, 0x55};
+const int PACKET_SIZE = 12;
+const unsigned long SAMPLE_PERIOD_US = 10000; // 100 Hz
+
 int buttonState = 0;
 
 int minPotValue = 1023;
 int maxPotValue = 0;
 
 int potValue = 0;
-float filteredPotValue = 0.0; 
-const float alpha = 0.9; // Smoothing factor 
+float filteredPotValue = 0.0;
+const float alpha = 0.9; // Smoothing factor
+
+uint16_t sequence = 0;
+unsigned long nextSample = 0;
+byte packet[PACKET_SIZE];
+
+uint16_t crc16(const byte *data, int length) {
+  uint16_t crc = 0;
+  for (int i = 0; i < length; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (int bit = 0; bit < 8; bit++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+  }
+  return crc;
+}
 
 void setup() {
   pinMode(buttonPin, INPUT);
   pinMode(redLEDPin, OUTPUT);
   pinMode(greenLEDPin, INPUT);
-  
+
   Serial.begin(115200);
 
   filteredPotValue = analogRead(potPin);
+  packet[0] = SYNC[0];
+  packet[1] = SYNC[1];
+  nextSample = micros();
 }
 
 void loop() {
+  // Sample on a fixed schedule instead of delaying after the work
+  while ((long)(micros() - nextSample) < 0) {}
+  unsigned long timestamp = micros();
+  nextSample += SAMPLE_PERIOD_US;
 
   // Read potentiometer state and auto-calibrate
   potValue = analogRead(potPin);
@@ -36,10 +65,21 @@ void loop() {
 
   // Read button state
   buttonState = digitalRead(buttonPin);
-  
+
   // Send data via serial port
-  String dataString = String(map(filteredPotValue, minPotValue, maxPotValue, 0, 100)) + "," + String(buttonState);
-  Serial.println(dataString);
-  
-  delay(10); // 100 Hz read
+  long triggerState = maxPotValue > minPotValue ? map(filteredPotValue, minPotValue, maxPotValue, 0, 100) : 0;
+
+  packet[2] = sequence & 0xFF;
+  packet[3] = sequence >> 8;
+  for (int i = 0; i < 4; i++) {
+    packet[4 + i] = (timestamp >> (8 * i)) & 0xFF;
+  }
+  packet[8] = constrain(triggerState, 0, 100);
+  packet[9] = buttonState;
+  uint16_t crc = crc16(packet + 2, 8);
+  packet[10] = crc & 0xFF;
+  packet[11] = crc >> 8;
+
+  Serial.write(packet, PACKET_SIZE);
+  sequence++;
 }
@@ -2,6 +2,7 @@
 # https://github.com/facebookresearch/fairo/blob/main/polymetis/polymetis/python/polymetis/robot_client/robotiq_gripper/third_party/robotiq_2finger_grippers/
 # https://github.com/Danfoa/robotiq_2finger_grippers/
 
+import asyncio
 import serial
 from serial.serialutil import SerialException
 
@@ -47,8 +48,9 @@ class Communication:
         """Close connection"""
         self.client.close()
 
-    def sendCommand(self, data):
-        """Send a command to the Gripper - the method takes a list of uint8 as an argument. The meaning of each variable depends on the Gripper model (see support.robotiq.com for more details)"""
+    @staticmethod
+    def _toRegisters(data):
+        """Combines a list of uint8 into registers of two bytes each"""
         # make sure data has an even number of elements
         if len(data) % 2 == 1:
             data.append(0)
@@ -60,6 +62,21 @@ class Communication:
         for i in range(0, len(data) // 2):
             message.append((data[2 * i] << 8) + data[2 * i + 1])
 
+        return message
+
+    @staticmethod
+    def _toBytes(registers):
+        """Splits registers into a list of uint8 in the appropriate order"""
+        output = []
+        for register in registers:
+            output.append((register & 0xFF00) >> 8)
+            output.append(register & 0x00FF)
+        return output
+
+    def sendCommand(self, data):
+        """Send a command to the Gripper - the method takes a list of uint8 as an argument. The meaning of each variable depends on the Gripper model (see support.robotiq.com for more details)"""
+        message = self._toRegisters(data)
+
         # To do!: Implement try/except
         try:
             self.client.write_registers(0x03E8, message, unit=0x0009)
@@ -88,21 +105,123 @@ class Communication:
         elif type(response) is ModbusIOException:
             return None
 
-        # Instantiate output as an empty list
-        output = []
+        # Output the bytes in the appropriate order
+        return self._toBytes(response.getRegister(i) for i in range(0, numRegs))
 
-        # Fill the output with the bytes in the appropriate order
-        for i in range(0, numRegs):
-            output.append((response.getRegister(i) & 0xFF00) >> 8)
-            output.append(response.getRegister(i) & 0x00FF)
+    def sendCommandGetStatus(self, data, numBytes):
+        """Sends a command and reads the Gripper status in a single transaction (function 23, read/write multiple registers). Returns the status like getStatus, None if the transaction failed"""
+        message = self._toRegisters(data)
+        numRegs = int(ceil(numBytes / 2.0))
 
-        # Output the result
-        return output
+        try:
+            response = self.client.readwrite_registers(
+                read_address=0x07D0,
+                read_count=numRegs,
+                write_address=0x03E8,
+                write_registers=message,
+                unit=0x0009,
+            )
+        except Exception as e:
+            print(e)
+            return None
+
+        if response is None or type(response) is ModbusIOException or response.isError():
+            return None
+
+        return self._toBytes(response.registers[:numRegs])
+
+class AsyncCommunication(Communication):
+    '''
+    Communication on the asyncio Modbus RTU client of pymodbus (requires pyserial-asyncio).
+    sendCommand, getStatus and sendCommandGetStatus are coroutines that have to run on self.loop.
+    Transactions are serialized since RTU is half-duplex and responses can't be matched to requests.
+    '''
+    def __init__(self, timeout=0.2):
+        super().__init__()
+        self.loop = None
+        self.lock = None
+        self.timeout = timeout
+
+    def connectToDevice(self, device):
+        """Connection to the client, blocks until connected."""
+        from pymodbus.client.asynchronous import schedulers
+        from pymodbus.client.asynchronous.serial import AsyncModbusSerialClient
+
+        self.loop, self.client = AsyncModbusSerialClient(
+            schedulers.ASYNC_IO,
+            method="rtu",
+            port=device,
+            stopbits=1,
+            bytesize=8,
+            baudrate=115200,
+            loop=asyncio.new_event_loop(),
+        )
+        if self.client.protocol is None:
+            print("Unable to connect to %s" % device)
+            return False
+        return True
+
+    def disconnectFromDevice(self):
+        """Close connection"""
+        self.client.stop()
+        self.loop.close()
+
+    async def _execute(self, method, *args, **kwargs):
+        """Sends a request once the bus is free and waits for the response."""
+        # Created on first use to be bound to the client's loop
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            request = getattr(self.client.protocol, method)(*args, **kwargs)
+            return await asyncio.wait_for(request, self.timeout)
+
+    async def sendCommand(self, data):
+        message = self._toRegisters(data)
+        try:
+            response = await self._execute("write_registers", 0x03E8, message, unit=0x0009)
+        except Exception:
+            print("Modbus write operation failure")
+            return False
+        return not response.isError()
+
+    async def getStatus(self, numBytes):
+        numRegs = int(ceil(numBytes / 2.0))
+        try:
+            response = await self._execute("read_holding_registers", 0x07D0, numRegs, unit=0x0009)
+        except Exception as e:
+            print(e)
+            return None
+
+        if response is None or type(response) is ModbusIOException or response.isError():
+            return None
+
+        return self._toBytes(response.registers[:numRegs])
+
+    async def sendCommandGetStatus(self, data, numBytes):
+        message = self._toRegisters(data)
+        numRegs = int(ceil(numBytes / 2.0))
+        try:
+            response = await self._execute(
+                "readwrite_registers",
+                read_address=0x07D0,
+                read_count=numRegs,
+                write_address=0x03E8,
+                write_registers=message,
+                unit=0x0009,
+            )
+        except Exception as e:
+            print(e)
+            return None
+
+        if response is None or type(response) is ModbusIOException or response.isError():
+            return None
+
+        return self._toBytes(response.registers[:numRegs])
 
 class Robotiq2FingerGripper:
-    def __init__(self, device_id=0, stroke=0.05, comport="/dev/ttyUSB0", baud=115200):
+    def __init__(self, device_id=0, stroke=0.05, comport="/dev/ttyUSB0", baud=115200, client=None):
 
-        self.client = Communication()
+        self.client = client or Communication()
 
         connected = self.client.connectToDevice(device=comport)
         if not connected:
@@ -138,8 +257,13 @@ class Robotiq2FingerGripper:
         """Request the status from the gripper and return it in the Robotiq2FGripper_robot_input msg type."""
 
         # Acquire status from the Gripper
-        status = self.client.getStatus(6)
+        return self._parseStatus(self.client.getStatus(6))
+
+    def sendCommandGetStatus(self):
+        """Send the command and request the status in one bus transaction."""
+        return self._parseStatus(self.client.sendCommandGetStatus(self.message, 6))
 
+    def _parseStatus(self, status):
         # Check if read was successful
         if status is None:
             return False
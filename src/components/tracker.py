@@ -12,11 +12,11 @@ class Tracker:
         self.zed = sl.Camera()
 
         init_params = sl.InitParameters()
-        init_params.camera_resolution = ZED["resolution"]
+        init_params.camera_resolution = getattr(sl.RESOLUTION, ZED["resolution"])
         init_params.camera_fps = ZED["fps"]
-        init_params.coordinate_system = ZED["coordinate_system"]
-        init_params.coordinate_units = ZED["units"]
-        init_params.depth_mode = ZED["depth_mode"]
+        init_params.coordinate_system = getattr(sl.COORDINATE_SYSTEM, ZED["coordinate_system"])
+        init_params.coordinate_units = getattr(sl.UNIT, ZED["units"])
+        init_params.depth_mode = getattr(sl.DEPTH_MODE, ZED["depth_mode"])
 
         err = self.zed.open(init_params)
         if err != sl.ERROR_CODE.SUCCESS:
@@ -26,6 +26,10 @@ class Tracker:
 
         self.runtime_parameters = sl.RuntimeParameters()
 
+        # Reused for every retrieved image
+        self.image = sl.Mat()
+        self.image_resolution = sl.Resolution(ZED["image_width"], ZED["image_height"])
+
         log.info("Grabbing initial frames")
         # Doing this because on the first frame the POSITIONAL_TRACKING_STATE is not OK
         for _ in range(30):
@@ -48,13 +52,17 @@ class Tracker:
     def grab_frame(self):
         return self.zed.grab(self.runtime_parameters) == sl.ERROR_CODE.SUCCESS
 
-    def get_image(self):
-        image = sl.Mat()
-
-        self.zed.retrieve_image(image, sl.VIEW.LEFT)
-        timestamp = image.timestamp.get_milliseconds()
+    def get_image(self, deep_copy=True):
+        """
+        Returns timestamp and BGRA image of the left camera at ZED["image_width"] x ZED["image_height"].
+        Without deep_copy the image is a view that's only valid until the next call.
+        """
+        self.zed.retrieve_image(
+            self.image, sl.VIEW.LEFT, sl.MEM.CPU, self.image_resolution
+        )
+        timestamp = self.image.timestamp.get_milliseconds()
 
-        return timestamp, image.get_data(deep_copy=True)
+        return timestamp, self.image.get_data(deep_copy=deep_copy)
 
     def get_ee_pose(self):
         timestamp, confidence, pose = self.get_pose_in_ee_frame()
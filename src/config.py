@@ -1,4 +1,3 @@
-import pyzed.sl as sl
 import numpy as np
 
 DATA_DIR = "/home/jannik/Repos/demonstration-interface/data"
@@ -6,6 +5,21 @@ DATA_DIR = "/home/jannik/Repos/demonstration-interface/data"
 RECORDER = {    
     "frequency": 30, # Hz
     "tracking_image": True,
+    "flush_frames": 30, # frames buffered by the episode writer before flushing to disk
+    "queue_size": 60, # max. frames in flight between recorder and writer process
+    "image_codec": None, # None (raw frames), "jpg" or "webp" for color and tracker images
+    "image_quality": 90, # [0,100] quality of the image codec
+    "encoder_processes": 2, # size of the image encoder pool
+    # Storage options per dataset, overriding the above. Keys:
+    #   "codec": "jpg", "webp" or "png" (lossless, also for uint16 depth), encoded per frame
+    #   "compression": HDF5 filter "gzip", "lzf", "lz4" or "zstd" (the latter two need hdf5plugin)
+    #   "level": codec quality or compression level, "shuffle": byte-shuffle, "chunk_frames": frames per chunk
+    # e.g. "depth_images": {"compression": "zstd", "level": 1, "shuffle": True}
+    # Use scripts/benchmark_codecs.py to compare the options on recorded episodes
+    "datasets": {},
+    # Checksums of the shared memory records, to detect torn reads on CPUs that may reorder
+    # stores (e.g. the ARM of a Jetson). None = only on CPUs other than x86, see src/streams.py
+    "stream_checksums": None,
 }
 
 REALSENSE = {
@@ -15,19 +29,95 @@ REALSENSE = {
     "depth_width": 640,
     "depth_height": 480,
     "depth_fps": 30,
+    "queue_capacity": 2, # framesets buffered between SDK and camera process
+    "timeout_ms": 1000, # max. time to wait for a frameset
 }
 
 ZED = {
-    "resolution": sl.RESOLUTION.HD720,
+    # Names of the pyzed.sl enums, resolved in Tracker (so the SDK is only needed for the real camera)
+    "resolution": "HD720", # sl.RESOLUTION
     "fps": 60,
-    "coordinate_system": sl.COORDINATE_SYSTEM.IMAGE,
-    "units": sl.UNIT.METER,
-    "depth_mode": sl.DEPTH_MODE.PERFORMANCE,
+    "coordinate_system": "IMAGE", # sl.COORDINATE_SYSTEM
+    "units": "METER", # sl.UNIT
+    "depth_mode": "PERFORMANCE", # sl.DEPTH_MODE
     "pose_smooting": True,
+    "image_width": 640, # tracker image is retrieved at this resolution (BGR, no alpha)
+    "image_height": 360,
+    "image_fps": RECORDER["frequency"], # tracker images are only retrieved as fast as they're recorded
 }
 
+GRIP = {
+    "baudrate": 115200, # has to match arduino_interface.ino
+    "read_timeout": 0.1, # seconds a read waits for the next packet
+}
 GRIPPER = {
-    "control_frequency": 30 # Hz
+    "control_frequency": 30, # Hz
+    # Asyncio controller (src/recorder.py control_gripper) instead of the synchronous loop
+    "asynchronous": False,
+    "command_frequency": 200, # Hz, trigger checks, changed positions are sent immediately
+    "status_frequency": 10, # Hz, polling of the gripper state
+    # read_grip notifies the asynchronous controller of trigger changes through a pipe
+    "trigger_events": False,
+    "motion_threshold": 1, # %, position change counted as motion by the latency measurement
+}
+
+# Loop statistics, reported by a separate process (src/stats.py)
+SCHEDULER = {
+    "busy_wait": 0.0005, # seconds spun before a deadline instead of sleeping
+    "missed_ticks": "skip", # "skip" or "catch_up" after a loop overran its period
+    # Per process (grip, tracker, camera, gripper, recorder) settings, e.g. "recorder": [3]
+    "cpus": {}, # CPU affinity
+    "fifo_priority": {}, # SCHED_FIFO priority [1,99], requires CAP_SYS_NICE or an rtprio limit
+}
+STATS = {
+    "report_interval": 0.5, # seconds between status line updates and JSON dumps
+    "port": 9100, # Prometheus text endpoint at http://<host>:<port>/metrics, None to disable
+    "json_path": None, # path of a periodic JSON dump of all loop statistics, None to disable
+}
+
+# Hardware-free components (src/components/simulated.py), also enabled by record_session.py --simulate
+SIMULATION = {
+    "enabled": False,
+    "episode": None, # episode .h5 file to replay, synthetic data if None
+    "speed": 1.0, # playback rate, > 1 is faster than real time
+    "jitter": 0.0, # std. deviation of the sample period in seconds
+    "button_period": 10.0, # seconds between simulated button presses (start/stop recording), None = never
+    "bus_latency": 0.005, # seconds per simulated gripper transaction
+}
+VICON = {
+    "cache_dir": "~/.cache/demonstration-interface/vicon", # parsed CSV exports, see src/vicon.py
+    "chunk_rows": 100000, # rows parsed at once
+    "frame_rate": 100, # Hz, if not given in the export
+    # Markers of the rigid body, names or indices of the X, Y, Z column triples (None = all).
+    # The exports also hold other triples (e.g. magnitudes) after the 5 markers
+    "markers": (0, 1, 2, 3, 4),
+}
+
+VIEWER = {
+    "source": "RealSense", # "RealSense" or "ZED" (opened by web_viewer/app.py) or "recorder" (shared streams of a running recorder)
+    "preview_fps": 10, # Hz, frames read from the recorder and encoded in "recorder" mode
+    "quality": 80, # [0,100] default JPEG quality of the previews
+    "fps": 30, # default and maximum frame rate of a preview client
+}
+
+TELEMETRY = {
+    "frequency": 60, # Hz, max. rate at which the viewer samples pose, trigger and gripper state of the recorder
+    "batch_interval": 0.1, # seconds between WebSocket messages, each carries all samples since the last one
+    "history": 600, # samples kept for clients that fall behind
+}
+
+DATASET = {
+    "output_dir": None, # training dataset converted from the episodes, "dataset" next to DATA_DIR by default, see src/dataset.py
+    "image_size": (128, 128), # (width, height) of the resized image observations
+    "images": ("color_images",), # image datasets converted to observations, if present in an episode
+    "actions": "relative", # "relative" (motion to the next pose in the current end effector frame) or "absolute" (next pose)
+    "compression": {"compression": "lzf"}, # HDF5 filter of the image observations, see src/episode.py
+    "processes": None, # size of the conversion pool, all cores by default
+}
+
+CATALOG = {
+    "path": None, # SQLite index of the episodes, DATA_DIR/catalog.sqlite by default, see src/catalog.py
+    "update_on_save": True, # index episodes in the writer process after saving them
 }
 
 
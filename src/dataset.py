@@ -0,0 +1,318 @@
+"""
+Conversion of recorded episodes to a training dataset:
+
+    <output_dir>/
+    ├─ manifest.json        source episodes, their content hashes and moments
+    ├─ stats.json           {dataset: {count, mean, std, min, max}} over all episodes
+    └─ episodes/<hash>.h5   one file per source episode:
+         observations/<image dataset>  (T, height, width, 3) uint8, RGB, resized
+         observations/state            (T, 7) float32, [position, axis-angle, gripper state]
+         actions                       (T, 7) float32, [translation, axis-angle, gripper state]
+         timestamps                    (T,) uint64
+
+Actions are the motion to the pose of the next frame in the end effector frame of
+the current one ("relative") or the next pose itself ("absolute"), together with the
+next gripper state. The last frame repeats the last pose.
+
+Episodes are converted in a pool of processes. Only episodes whose content hash or
+conversion parameters changed are converted again. The statistics are merged from
+per-episode moments with the parallel algorithm of Chan et al., without reading
+the episodes that didn't change.
+"""
+import hashlib
+import json
+import logging
+import multiprocessing as mp
+import os
+import glob
+import cv2
+import h5py
+import numpy as np
+from tqdm import tqdm
+
+from src.catalog import EPISODE_DATASETS
+from src.config import DATASET, DATA_DIR
+from src.episode import EpisodeReader, filter_kwargs
+from src.poses import compose, invert, matrix_to_axis_angle
+
+log = logging.getLogger(__name__)
+
+VERSION = 1  # bump when the converted files change
+HASH_BLOCK = 16 * 1024 * 1024
+REQUIRED_DATASETS = EPISODE_DATASETS + ("gripper_states",)
+
+
+def content_hash(file_path):
+    """
+    BLAKE2b digest of the file contents.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def conversion_parameters():
+    """
+    Parameters that change the converted files, part of the key of every episode.
+    """
+    return {
+        "version": VERSION,
+        "image_size": list(DATASET["image_size"]),
+        "images": list(DATASET["images"]),
+        "actions": DATASET["actions"],
+    }
+
+
+def moments(values):
+    """
+    Returns the moments {count, mean, m2, min, max} of values (N, ...) over the first axis.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    mean = values.mean(axis=0)
+    return {
+        "count": len(values),
+        "mean": mean,
+        "m2": ((values - mean) ** 2).sum(axis=0),
+        "min": values.min(axis=0),
+        "max": values.max(axis=0),
+    }
+
+
+def combine_moments(a, b):
+    """
+    Moments of the union of two sets from the moments of both (Chan et al.).
+    """
+    if a is None or not a["count"]:
+        return b
+    if b is None or not b["count"]:
+        return a
+    count = a["count"] + b["count"]
+    delta = np.asarray(b["mean"]) - np.asarray(a["mean"])
+    return {
+        "count": count,
+        "mean": np.asarray(a["mean"]) + delta * b["count"] / count,
+        "m2": np.asarray(a["m2"]) + np.asarray(b["m2"]) + delta**2 * a["count"] * b["count"] / count,
+        "min": np.minimum(a["min"], b["min"]),
+        "max": np.maximum(a["max"], b["max"]),
+    }
+
+
+def states_and_actions(poses, gripper_states, mode):
+    """
+    Returns the states and actions (T, 7) of an episode, see the module docstring.
+    """
+    gripper_states = np.asarray(gripper_states, dtype=np.float64)[:, None]
+    states = np.concatenate(
+        [poses[:, :3, 3], matrix_to_axis_angle(poses[:, :3, :3]), gripper_states], axis=1
+    )
+
+    following = np.concatenate([poses[1:], poses[-1:]])
+    following_gripper = np.concatenate([gripper_states[1:], gripper_states[-1:]])
+    if mode == "relative":
+        motion = compose(invert(poses), following)
+    elif mode == "absolute":
+        motion = following
+    else:
+        raise Exception(f"Unknown action mode: {mode}")
+    actions = np.concatenate(
+        [motion[:, :3, 3], matrix_to_axis_angle(motion[:, :3, :3]), following_gripper], axis=1
+    )
+    return states.astype(np.float32), actions.astype(np.float32)
+
+
+def convert_episode(file_path, output_path):
+    """
+    Converts an episode to output_path, returns {"frames", "moments": {dataset: moments}}.
+    """
+    width, height = DATASET["image_size"]
+    result = {}
+    temporary_path = f"{output_path}.{os.getpid()}.tmp"
+    with EpisodeReader(file_path) as episode, h5py.File(temporary_path, "w") as f:
+        poses = episode["pose_values"].read()
+        states, actions = states_and_actions(poses, episode["gripper_states"].read(), DATASET["actions"])
+        f.create_dataset("timestamps", data=episode["timestamps"].read())
+        f.create_dataset("observations/state", data=states)
+        f.create_dataset("actions", data=actions)
+        result["observations/state"] = moments(states)
+        result["actions"] = moments(actions)
+
+        for name in DATASET["images"]:
+            if name not in episode:
+                continue
+            dataset = f.create_dataset(
+                f"observations/{name}",
+                shape=(len(episode), height, width, 3),
+                dtype=np.uint8,
+                chunks=(1, height, width, 3),
+                **filter_kwargs(DATASET["compression"] or {}),
+            )
+            # Per channel statistics of the pixels in [0, 1], merged chunk by chunk
+            image_moments = None
+            images = episode[name]
+            block = 64
+            for start in range(0, len(images), block):
+                chunk = images[start:start + block].read()
+                resized = np.stack(
+                    [cv2.resize(image[..., :3], (width, height), interpolation=cv2.INTER_AREA) for image in chunk]
+                )
+                dataset[start:start + len(resized)] = resized
+                pixels = resized.reshape(-1, 3) / 255.0
+                image_moments = combine_moments(image_moments, moments(pixels))
+            result[f"observations/{name}"] = image_moments
+
+    os.replace(temporary_path, output_path)
+    return {"frames": len(states), "moments": {name: _to_json(m) for name, m in result.items() if m}}
+
+
+def _to_json(moments):
+    return {key: np.asarray(value).tolist() if key != "count" else int(value) for key, value in moments.items()}
+
+
+def _convert_task(task):
+    """
+    Hashes a source episode and converts it unless its content is already converted.
+    Files that aren't episodes or fail to convert are logged and return entry None.
+    """
+    file_path = task[0]
+    try:
+        with h5py.File(file_path, "r") as f:
+            missing = [name for name in REQUIRED_DATASETS if name not in f]
+        if missing:
+            log.info(f"Skipped {file_path}, not an episode (no {', '.join(missing)})")
+            return file_path, None, False
+        return _convert(*task)
+    except Exception as e:
+        log.warning(f"Could not convert {file_path}: {e}")
+        return file_path, None, False
+
+
+def _convert(file_path, entry, known, output_dir):
+    entry = dict(entry)
+    stat = os.stat(file_path)
+    if entry.get("size") != stat.st_size or entry.get("mtime_ns") != stat.st_mtime_ns or "hash" not in entry:
+        entry["hash"] = content_hash(file_path)
+    entry["size"] = stat.st_size
+    entry["mtime_ns"] = stat.st_mtime_ns
+
+    # A copied or touched file with the same content reuses the existing conversion
+    if entry["hash"] in known:
+        return file_path, dict(known[entry["hash"]], **entry), False
+
+    entry["file"] = os.path.join("episodes", f"{entry['hash']}.h5")
+    entry.update(convert_episode(file_path, os.path.join(output_dir, entry["file"])))
+    return file_path, entry, True
+
+
+def default_output_dir():
+    """
+    Next to DATA_DIR, so that the dataset isn't converted again or indexed as episodes.
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(DATA_DIR)), "dataset")
+
+
+def load_manifest(output_dir):
+    path = os.path.join(output_dir, "manifest.json")
+    if not os.path.exists(path):
+        return {"parameters": None, "episodes": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_json(path, data):
+    with open(path + ".tmp", "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def convert_sessions(directories, output_dir=None, processes=None, force=False):
+    """
+    Converts the episodes found below directories to the dataset in output_dir (see
+    the module docstring). Files that aren't episodes or fail to convert are skipped.
+    Returns (converted, unchanged, removed) counts.
+    """
+    output_dir = output_dir or DATASET["output_dir"] or default_output_dir()
+    os.makedirs(os.path.join(output_dir, "episodes"), exist_ok=True)
+
+    manifest = load_manifest(output_dir)
+    parameters = conversion_parameters()
+    if force or manifest["parameters"] != parameters:
+        if manifest["episodes"]:
+            log.warning("Conversion parameters changed, converting all episodes again")
+        manifest = {"parameters": parameters, "episodes": {}}
+    previous = manifest["episodes"]
+
+    file_paths = sorted(
+        {
+            os.path.abspath(file_path)
+            for directory in directories
+            for file_path in glob.glob(os.path.join(directory, "**", "*.h5"), recursive=True)
+            if not os.path.abspath(file_path).startswith(os.path.abspath(output_dir) + os.sep)
+        }
+    )
+
+    # Converted contents by hash, so an episode is converted once even if it was moved
+    known = {
+        entry["hash"]: {key: entry[key] for key in ("file", "frames", "moments")}
+        for entry in previous.values()
+        if os.path.exists(os.path.join(output_dir, entry["file"]))
+    }
+    tasks = []
+    episodes = {}
+    for file_path in file_paths:
+        entry = previous.get(file_path, {})
+        stat = os.stat(file_path)
+        unchanged = (entry.get("size"), entry.get("mtime_ns")) == (stat.st_size, stat.st_mtime_ns)
+        if unchanged and entry.get("hash") in known:
+            episodes[file_path] = entry
+        else:
+            tasks.append((file_path, entry, known, output_dir))
+
+    converted = skipped = 0
+    if tasks:
+        with mp.Pool(processes or DATASET["processes"]) as pool:
+            results = pool.imap_unordered(_convert_task, tasks)
+            for file_path, entry, was_converted in tqdm(results, total=len(tasks), unit="episodes"):
+                if entry is None:
+                    skipped += 1
+                    continue
+                episodes[file_path] = entry
+                converted += was_converted
+
+    # Converted files of episodes that are gone or changed, and leftovers of interrupted conversions
+    used = {os.path.join(output_dir, entry["file"]) for entry in episodes.values()}
+    for file_path in glob.glob(os.path.join(output_dir, "episodes", "*")):
+        if file_path not in used:
+            os.remove(file_path)
+    removed = len(set(previous) - set(episodes))
+
+    manifest = {"parameters": parameters, "episodes": {path: episodes[path] for path in sorted(episodes)}}
+    _write_json(os.path.join(output_dir, "manifest.json"), manifest)
+    _write_json(os.path.join(output_dir, "stats.json"), dataset_stats(manifest))
+    return converted, len(file_paths) - converted - skipped, removed
+
+
+def dataset_stats(manifest):
+    """
+    Returns {dataset: {count, mean, std, min, max}} merged from the moments of all
+    episodes, in a fixed order so that the result doesn't depend on the pool.
+    Every distinct episode content counts once.
+    """
+    totals = {}
+    contents = {entry["hash"]: entry for entry in manifest["episodes"].values()}
+    for _, entry in sorted(contents.items()):
+        for name, m in entry["moments"].items():
+            totals[name] = combine_moments(totals.get(name), m)
+
+    stats = {}
+    for name, m in totals.items():
+        std = np.sqrt(np.asarray(m["m2"]) / max(m["count"], 1))
+        stats[name] = {
+            "count": int(m["count"]),
+            "mean": np.asarray(m["mean"]).tolist(),
+            "std": std.tolist(),
+            "min": np.asarray(m["min"]).tolist(),
+            "max": np.asarray(m["max"]).tolist(),
+        }
+    return stats
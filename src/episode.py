@@ -0,0 +1,502 @@
+import logging
+import signal
+import time
+import multiprocessing as mp
+import cv2
+import h5py
+import numpy as np
+
+try:
+    import hdf5plugin  # registers the LZ4 and Zstd filters, for writing and reading
+except ImportError:
+    hdf5plugin = None
+
+from src.config import RECORDER, REALSENSE, ZED, CATALOG
+
+log = logging.getLogger(__name__)
+
+CHUNK_BYTES = 1024 * 1024  # target size of a single HDF5 chunk
+ENCODED_DATASETS = ("color_images", "tracker_images")  # stored with RECORDER["image_codec"]
+
+
+def episode_layout():
+    """
+    Returns the datasets of an episode file as {name: (shape per frame, dtype)}.
+    See data/FORMAT.md
+    """
+    layout = {
+        "timestamps": ((), "uint64"),
+        "trigger_timestamps": ((), "uint64"),
+        "trigger_states": ((), "uint8"),
+        "gripper_timestamps": ((), "uint64"),
+        "gripper_states": ((), "uint8"),
+        "image_timestamps": ((), "uint64"),
+        "image_frame_numbers": ((), "uint64"),
+        "color_images": (
+            (REALSENSE["color_height"], REALSENSE["color_width"], 3),
+            "uint8",
+        ),
+        "depth_images": (
+            (REALSENSE["depth_height"], REALSENSE["depth_width"]),
+            "uint16",
+        ),
+        "pose_timestamps": ((), "uint64"),
+        "pose_values": ((4, 4), "float64"),
+        "pose_confidences": ((), "uint8"),
+    }
+    if RECORDER["tracking_image"]:
+        layout["tracker_images"] = (
+            (ZED["image_height"], ZED["image_width"], 3),
+            "uint8",
+        )
+
+    return layout
+
+
+def chunk_shape(shape, dtype, max_frames):
+    """
+    Chunk of whole frames with roughly CHUNK_BYTES, at most max_frames long.
+    """
+    frame_bytes = int(np.prod(shape, dtype=np.int64)) * np.dtype(dtype).itemsize
+    frames = int(np.clip(CHUNK_BYTES // max(frame_bytes, 1), 1, max_frames))
+    return (frames,) + tuple(shape)
+
+
+def dataset_options(name):
+    """
+    Storage options of a dataset: RECORDER["image_codec"] for ENCODED_DATASETS,
+    overridden by RECORDER["datasets"][name].
+    """
+    options = {}
+    if name in ENCODED_DATASETS and RECORDER["image_codec"]:
+        options["codec"] = RECORDER["image_codec"]
+        options["level"] = RECORDER["image_quality"]
+    options.update(RECORDER["datasets"].get(name, {}))
+    return options
+
+
+def filter_kwargs(options):
+    """
+    Returns the h5py create_dataset arguments of the HDF5 filter in options.
+    """
+    compression = options.get("compression")
+    shuffle = options.get("shuffle", False)
+    level = options.get("level")
+
+    if compression is None:
+        return {"shuffle": shuffle} if shuffle else {}
+    if compression == "gzip":
+        return {"compression": "gzip", "compression_opts": level or 4, "shuffle": shuffle}
+    if compression == "lzf":
+        return {"compression": "lzf", "shuffle": shuffle}
+    if compression in ("lz4", "zstd"):
+        if hdf5plugin is None:
+            raise Exception(f"{compression} compression requires hdf5plugin (pip install hdf5plugin)")
+        # Blosc does the byte-shuffle itself, multi-threaded
+        return dict(
+            hdf5plugin.Blosc(
+                cname=compression,
+                clevel=level or 5,
+                shuffle=hdf5plugin.Blosc.SHUFFLE if shuffle else hdf5plugin.Blosc.NOSHUFFLE,
+            )
+        )
+    raise Exception(f"Unknown compression: {compression}")
+
+
+def encode_image(image, codec, level):
+    """
+    Encodes an image to a buffer of the given codec: "jpg" and "webp" (BGR, level
+    is the quality) or "png" (BGR or 16-bit, level is the compression).
+    The alpha channel is dropped.
+    """
+    if image.ndim == 3 and image.shape[2] == 4:
+        image = cv2.cvtColor(image, cv2.COLOR_BGRA2BGR)
+
+    if codec == "jpg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, level]
+    elif codec == "webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, level]
+    elif codec == "png":
+        params = [cv2.IMWRITE_PNG_COMPRESSION, level]
+    else:
+        raise Exception(f"Unknown image codec: {codec}")
+
+    success, buffer = cv2.imencode(f".{codec}", image, params)
+    if not success:
+        raise Exception(f"Failed to encode image as {codec}")
+    return buffer.ravel()
+
+
+def decode_image(buffer):
+    return cv2.imdecode(np.asarray(buffer, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+
+
+def read_frames(dataset, selection=slice(None)):
+    """
+    Reads frames of a dataset, decoding them if they are stored encoded.
+    Indices of the frames are the same as for all other datasets (e.g. image_timestamps).
+    """
+    data = dataset[selection]
+    if "codec" not in dataset.attrs:
+        return data
+
+    if isinstance(selection, (int, np.integer)):
+        return decode_image(data)
+    return np.array([decode_image(buffer) for buffer in data])
+
+
+def bgr_to_rgb(images):
+    """
+    Swaps the color channels of BGR(A) images of any leading shape to RGB(A).
+    """
+    if images.ndim < 3:
+        return images  # no frames
+    order = [2, 1, 0, 3] if images.shape[-1] == 4 else [2, 1, 0]
+    return np.ascontiguousarray(images[..., order])
+
+
+class StreamView:
+    """
+    Lazy view of the frames rows (a range of frame indices) of a dataset. Nothing is
+    read until the view is indexed with an integer, iterated or converted to an array:
+
+        view[10]        a single frame
+        view[10:20]     another lazy view
+        view.read()     all frames of the view as an array
+        for frame in view: ...  frames read in blocks of a dataset chunk
+
+    Encoded frames are decoded and convert (e.g. bgr_to_rgb) is applied on access.
+    """
+
+    def __init__(self, dataset, rows=None, convert=None):
+        self.dataset = dataset
+        self.rows = range(len(dataset)) if rows is None else rows
+        self.convert = convert
+
+    @property
+    def name(self):
+        return self.dataset.name.lstrip("/")
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __repr__(self):
+        return f"<StreamView {self.name} ({len(self)} frames)>"
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return StreamView(self.dataset, self.rows[key], self.convert)
+        if isinstance(key, (int, np.integer)):
+            return self._read(self.rows[key])
+        return self._read_indices(np.asarray(key))
+
+    def __iter__(self):
+        block = self.dataset.chunks[0] if self.dataset.chunks else 64
+        for start in range(0, len(self), block):
+            yield from self[start:start + block].read()
+
+    def __array__(self, dtype=None):
+        data = self.read()
+        return data if dtype is None else data.astype(dtype)
+
+    def read(self):
+        """
+        Reads all frames of the view.
+        """
+        rows = self.rows
+        if len(rows) == 0:
+            return self._read(slice(0, 0))
+        if rows.step < 0:
+            return self._read(slice(rows[-1], rows[0] + 1, -rows.step))[::-1]
+        return self._read(slice(rows.start, rows[-1] + 1, rows.step))
+
+    def _read_indices(self, indices):
+        if indices.dtype == bool:
+            indices = np.flatnonzero(indices)
+        rows = np.asarray(self.rows)[indices]
+        # h5py needs increasing, unique indices
+        unique, inverse = np.unique(rows, return_inverse=True)
+        return self._read(unique)[inverse]
+
+    def _read(self, selection):
+        data = read_frames(self.dataset, selection)
+        return self.convert(data) if self.convert else data
+
+
+class EpisodeReader:
+    """
+    Read-only access to an episode file without loading it into memory. Streams
+    are StreamViews of the datasets, restricted to the frames of the reader:
+
+        with EpisodeReader(file_path) as episode:
+            part = episode.between(5.0, 10.0)  # seconds from the start of the episode
+            for image in part["color_images"]:
+                ...
+
+    With rgb, color and tracker images are converted from BGR to RGB on access.
+    """
+
+    def __init__(self, file_path, rgb=True, frames=None, file=None):
+        self.file_path = file_path
+        self.file = file or h5py.File(file_path, "r")
+        self.rgb = rgb
+        self.frames = range(len(self.file["timestamps"]))
+        if frames is not None:
+            self.frames = self.frames[frames]
+        self._timestamps = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __contains__(self, name):
+        return name in self.file
+
+    def __repr__(self):
+        return f"<EpisodeReader {self.file_path} ({len(self)} frames)>"
+
+    def keys(self):
+        return list(self.file.keys())
+
+    def __getitem__(self, name):
+        if name not in self.file:
+            raise KeyError(f"{self.file_path} has no dataset {name}")
+        convert = bgr_to_rgb if self.rgb and name in ENCODED_DATASETS else None
+        return StreamView(self.file[name], self.frames, convert)
+
+    @property
+    def timestamps(self):
+        """
+        Logging timestamps of all frames of the episode in nanoseconds, read once.
+        """
+        if self._timestamps is None:
+            self._timestamps = self.file["timestamps"][:]
+        return self._timestamps
+
+    @property
+    def times(self):
+        """
+        Seconds since the first frame of the episode, for the frames of the reader.
+        """
+        timestamps = self.timestamps
+        if len(timestamps) == 0:
+            return np.zeros(0)
+        return (timestamps[np.asarray(self.frames)] - timestamps[0]) / 1e9
+
+    @property
+    def duration(self):
+        times = self.times
+        return float(times[-1] - times[0]) if len(times) else 0.0
+
+    def select(self, frames):
+        """
+        Returns a reader of the frames selected by a slice of the frames of this reader.
+        """
+        reader = EpisodeReader(self.file_path, self.rgb, file=self.file)
+        reader.frames = self.frames[frames]
+        reader._timestamps = self._timestamps
+        return reader
+
+    def between(self, start=None, stop=None):
+        """
+        Returns a reader of the frames logged in [start, stop) seconds since the
+        first frame of the episode.
+        """
+        times = self.times
+        if len(times) and self.frames.step < 0:
+            raise Exception("Time ranges of reversed readers are not supported")
+        first = 0 if start is None else int(np.searchsorted(times, start, side="left"))
+        last = len(times) if stop is None else int(np.searchsorted(times, stop, side="left"))
+        return self.select(slice(first, last))
+
+
+class EpisodeWriter:
+    """
+    Appends frames to resizable, chunked HDF5 datasets.
+    Frames are buffered in preallocated arrays and flushed to disk every
+    flush_frames, so memory stays bounded regardless of the episode length and
+    everything up to the last flush survives a crash.
+
+    options holds the storage options per dataset (see dataset_options). Datasets
+    with a codec are stored as variable-length buffers and encoded asynchronously
+    by the process pool, if given.
+    """
+
+    def __init__(
+        self,
+        file_path,
+        layout=None,
+        options=None,
+        flush_frames=RECORDER["flush_frames"],
+        pool=None,
+    ):
+        self.file_path = file_path
+        self.flush_frames = flush_frames
+        self.layout = layout or episode_layout()
+        if options is None:
+            options = {name: dataset_options(name) for name in self.layout}
+        self.options = options
+        self.pool = pool
+
+        self.file = h5py.File(file_path, "w")
+        self.datasets = {}
+        self.buffers = {}
+        self.codecs = {}
+        for name, (shape, dtype) in self.layout.items():
+            _options = options.get(name, {})
+            chunk_frames = _options.get("chunk_frames")
+
+            if _options.get("codec"):
+                dataset = self.file.create_dataset(
+                    name,
+                    shape=(0,),
+                    maxshape=(None,),
+                    chunks=(chunk_frames or flush_frames,),
+                    dtype=h5py.vlen_dtype(np.uint8),
+                )
+                dataset.attrs["codec"] = _options["codec"]
+                dataset.attrs["level"] = _options.get("level", 1)
+                self.codecs[name] = (_options["codec"], _options.get("level", 1))
+                self.buffers[name] = []  # encoded buffers (or pending results)
+            else:
+                if chunk_frames:
+                    chunks = (chunk_frames,) + tuple(shape)
+                else:
+                    chunks = chunk_shape(shape, dtype, flush_frames)
+                dataset = self.file.create_dataset(
+                    name,
+                    shape=(0,) + tuple(shape),
+                    maxshape=(None,) + tuple(shape),
+                    chunks=chunks,
+                    dtype=dtype,
+                    **filter_kwargs(_options),
+                )
+                self.buffers[name] = np.empty((flush_frames,) + tuple(shape), dtype=dtype)
+            self.datasets[name] = dataset
+
+        self.buffered = 0  # frames waiting in the buffers
+        self.length = 0  # frames written to the file
+
+    def append(self, frame):
+        """
+        Appends a single frame given as {dataset name: value}.
+        """
+        for name, buffer in self.buffers.items():
+            if isinstance(buffer, list):
+                args = (frame[name],) + self.codecs[name]
+                if self.pool is not None:
+                    buffer.append(self.pool.apply_async(encode_image, args))
+                else:
+                    buffer.append(encode_image(*args))
+            else:
+                buffer[self.buffered] = frame[name]
+        self.buffered += 1
+
+        if self.buffered == self.flush_frames:
+            self.flush()
+
+    def flush(self):
+        if self.buffered:
+            start = self.length
+            stop = self.length + self.buffered
+            for name, dataset in self.datasets.items():
+                buffer = self.buffers[name]
+                dataset.resize(stop, axis=0)
+                if isinstance(buffer, list):
+                    for i, result in enumerate(buffer):
+                        dataset[start + i] = result.get() if self.pool is not None else result
+                    buffer.clear()
+                else:
+                    dataset[start:stop] = buffer[: self.buffered]
+            self.length = stop
+            self.buffered = 0
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+        log.debug(f"Wrote {self.length} frames to {self.file_path}")
+
+    def __len__(self):
+        return self.length + self.buffered
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def index_episode(file_path):
+    """
+    Adds a saved episode to the catalog if it is in the directory of the catalog.
+    Failures are logged, they must not stop the recording.
+    """
+    from src.catalog import open_catalog, in_catalog, update_episode  # the catalog reads episodes
+
+    if not in_catalog(file_path):
+        return
+    try:
+        connection = open_catalog()
+        try:
+            update_episode(connection, file_path)
+        finally:
+            connection.close()
+    except Exception as e:
+        log.warning(f"Could not add {file_path} to the catalog: {e}")
+
+
+def write_episodes(queue, events=None):
+    """
+    Target of the writer process. Consumes messages from the recorder:
+    ("open", file_path), ("frame", {name: value}), ("close", time.monotonic() of the
+    stop) and None to exit. SIGINT is ignored, the recorder sends None once it stops,
+    so queued frames are still written on Ctrl+C.
+    After saving an episode ("saved", file_path, frames, seconds to finalize) is put to events.
+    Saved episodes are added to the catalog with CATALOG["update_on_save"].
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    writer = None
+
+    pool = None
+    if any(dataset_options(name).get("codec") for name in episode_layout()):
+        pool = mp.Pool(RECORDER["encoder_processes"])
+
+    try:
+        while True:
+            message = queue.get()
+            if message is None:
+                break
+
+            command, payload = message
+            if command == "open":
+                writer = EpisodeWriter(payload, pool=pool)
+            elif command == "frame":
+                writer.append(payload)
+            elif command == "close":
+                file_path = writer.file_path
+                frames = len(writer)
+                writer.close()
+                writer = None
+                finalize_time = time.monotonic() - payload
+                log.warning(f"Saved {file_path}")
+                if CATALOG["update_on_save"]:
+                    index_episode(file_path)
+                if events is not None:
+                    events.put(("saved", file_path, frames, finalize_time))
+
+    finally:
+        if writer is not None:
+            log.warning(f"Closing unfinished episode {writer.file_path}")
+            writer.close()
+        if pool is not None:
+            pool.close()
+            pool.join()
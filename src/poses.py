@@ -0,0 +1,186 @@
+"""
+Batched rigid transformations. All functions work on stacks of any leading shape,
+e.g. poses of shape (N, 4, 4), rotations (N, 3, 3) and point sets (N, M, 3).
+Quaternions are scalar-last [x, y, z, w] like the ZED SDK and scipy, axis-angle
+is a rotation vector (unit axis times the angle in radians).
+"""
+import numpy as np
+
+
+def make_poses(rotations, translations):
+    """
+    Returns homogeneous transformations (..., 4, 4) from rotations (..., 3, 3) and translations (..., 3).
+    """
+    rotations = np.asarray(rotations)
+    translations = np.asarray(translations)
+    shape = np.broadcast_shapes(rotations.shape[:-2], translations.shape[:-1])
+    poses = np.zeros(shape + (4, 4), dtype=np.result_type(rotations, translations, np.float64))
+    poses[..., :3, :3] = rotations
+    poses[..., :3, 3] = translations
+    poses[..., 3, 3] = 1.0
+    return poses
+
+
+def compose(a, b):
+    """
+    Returns a @ b for stacks of transformations, broadcasting single ones.
+    """
+    return np.matmul(a, b)
+
+
+def invert(poses):
+    """
+    Inverts rigid transformations using the transposed rotation, without a general matrix inverse.
+    """
+    rotations = np.swapaxes(poses[..., :3, :3], -1, -2)
+    translations = -np.einsum("...ij,...j->...i", rotations, poses[..., :3, 3])
+    return make_poses(rotations, translations)
+
+
+def transform_points(poses, points):
+    """
+    Applies transformations (..., 4, 4) to points (..., M, 3).
+    """
+    return np.einsum("...ij,...mj->...mi", poses[..., :3, :3], points) + poses[..., None, :3, 3]
+
+
+def kabsch_rotation(a, b):
+    """
+    Rotations R (..., 3, 3) minimizing sum ||R a_m - b_m||^2 over the point sets a and b
+    (..., M, 3) as they are, i.e. without removing their centroids. One SVD per stack entry,
+    reflections are corrected.
+    """
+    h = np.einsum("...mi,...mj->...ij", a, b)
+    u, _, vt = np.linalg.svd(h)
+    v = np.swapaxes(vt, -1, -2)
+    ut = np.swapaxes(u, -1, -2)
+    # Flip the last singular vector where the solution would be a reflection
+    d = np.sign(np.linalg.det(v @ ut))
+    d = np.where(d == 0, 1.0, d)
+    v = v.copy()
+    v[..., :, -1] *= d[..., None]
+    return v @ ut
+
+
+def kabsch(a, b):
+    """
+    Rigid transformations (..., 4, 4) best mapping the point sets a onto b (..., M, 3)
+    in the least-squares sense (Kabsch algorithm).
+    """
+    centroid_a = a.mean(axis=-2)
+    centroid_b = b.mean(axis=-2)
+    rotations = kabsch_rotation(a - centroid_a[..., None, :], b - centroid_b[..., None, :])
+    translations = centroid_b - np.einsum("...ij,...j->...i", rotations, centroid_a)
+    return make_poses(rotations, translations)
+
+
+def matrix_to_quaternion(rotations):
+    """
+    Quaternions [x, y, z, w] (..., 4) with w >= 0 from rotation matrices (..., 3, 3).
+    """
+    m = np.asarray(rotations, dtype=np.float64)
+    m00, m01, m02 = m[..., 0, 0], m[..., 0, 1], m[..., 0, 2]
+    m10, m11, m12 = m[..., 1, 0], m[..., 1, 1], m[..., 1, 2]
+    m20, m21, m22 = m[..., 2, 0], m[..., 2, 1], m[..., 2, 2]
+    trace = m00 + m11 + m22
+
+    # Candidates computed from the largest of the diagonal and the trace are well conditioned
+    candidates = np.stack(
+        [
+            np.stack([1 + m00 - m11 - m22, m01 + m10, m02 + m20, m21 - m12], axis=-1),
+            np.stack([m01 + m10, 1 - m00 + m11 - m22, m12 + m21, m02 - m20], axis=-1),
+            np.stack([m02 + m20, m12 + m21, 1 - m00 - m11 + m22, m10 - m01], axis=-1),
+            np.stack([m21 - m12, m02 - m20, m10 - m01, 1 + trace], axis=-1),
+        ],
+        axis=-2,
+    )
+    choice = np.argmax(np.stack([m00, m11, m22, trace], axis=-1), axis=-1)
+    quaternions = np.take_along_axis(candidates, choice[..., None, None], axis=-2)[..., 0, :]
+    quaternions /= np.linalg.norm(quaternions, axis=-1, keepdims=True)
+    return np.where(quaternions[..., 3:] < 0, -quaternions, quaternions)
+
+
+def quaternion_to_matrix(quaternions):
+    """
+    Rotation matrices (..., 3, 3) from quaternions [x, y, z, w] (..., 4), which are normalized first.
+    """
+    q = np.asarray(quaternions, dtype=np.float64)
+    q = q / np.linalg.norm(q, axis=-1, keepdims=True)
+    x, y, z, w = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    return np.stack(
+        [
+            np.stack([1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)], axis=-1),
+            np.stack([2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)], axis=-1),
+            np.stack([2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)], axis=-1),
+        ],
+        axis=-2,
+    )
+
+
+def quaternion_to_axis_angle(quaternions):
+    """
+    Rotation vectors (..., 3) with angles in [0, pi] from quaternions [x, y, z, w] (..., 4).
+    """
+    q = np.asarray(quaternions, dtype=np.float64)
+    q = q / np.linalg.norm(q, axis=-1, keepdims=True)
+    q = np.where(q[..., 3:] < 0, -q, q)
+    vector_norm = np.linalg.norm(q[..., :3], axis=-1)
+    angles = 2 * np.arctan2(vector_norm, q[..., 3])
+    # angle / sin(angle / 2), approaching 2 for small angles
+    small = vector_norm < 1e-8
+    scale = np.where(small, 2.0, angles / np.where(small, 1.0, vector_norm))
+    return q[..., :3] * scale[..., None]
+
+
+def axis_angle_to_quaternion(rotation_vectors):
+    """
+    Quaternions [x, y, z, w] (..., 4) from rotation vectors (..., 3).
+    """
+    v = np.asarray(rotation_vectors, dtype=np.float64)
+    angles = np.linalg.norm(v, axis=-1)
+    # sin(angle / 2) / angle, approaching 1/2 for small angles
+    small = angles < 1e-8
+    scale = np.where(small, 0.5, np.sin(angles / 2) / np.where(small, 1.0, angles))
+    return np.concatenate([v * scale[..., None], np.cos(angles / 2)[..., None]], axis=-1)
+
+
+def axis_angle_to_matrix(rotation_vectors):
+    """
+    Rotation matrices (..., 3, 3) from rotation vectors (..., 3).
+    """
+    return quaternion_to_matrix(axis_angle_to_quaternion(rotation_vectors))
+
+
+def matrix_to_axis_angle(rotations):
+    """
+    Rotation vectors (..., 3) from rotation matrices (..., 3, 3).
+    """
+    return quaternion_to_axis_angle(matrix_to_quaternion(rotations))
+
+
+def interpolate(poses, positions):
+    """
+    Poses at fractional indices positions into the sequence poses (N, 4, 4), with
+    linearly interpolated translations and spherically interpolated rotations.
+    """
+    positions = np.clip(np.asarray(positions, dtype=np.float64), 0, len(poses) - 1)
+    lower = np.clip(np.floor(positions).astype(int), 0, max(len(poses) - 2, 0))
+    upper = np.minimum(lower + 1, len(poses) - 1)
+    fraction = (positions - lower)[..., None]
+
+    translations = (1 - fraction) * poses[lower, :3, 3] + fraction * poses[upper, :3, 3]
+
+    q0 = matrix_to_quaternion(poses[lower, :3, :3])
+    q1 = matrix_to_quaternion(poses[upper, :3, :3])
+    # Take the shorter way
+    dot = np.sum(q0 * q1, axis=-1, keepdims=True)
+    q1 = np.where(dot < 0, -q1, q1)
+    dot = np.abs(dot)
+    angle = np.arccos(np.clip(dot, -1, 1))
+    small = angle < 1e-6
+    sin_angle = np.where(small, 1.0, np.sin(angle))
+    w0 = np.where(small, 1 - fraction, np.sin((1 - fraction) * angle) / sin_angle)
+    w1 = np.where(small, fraction, np.sin(fraction * angle) / sin_angle)
+    rotations = quaternion_to_matrix(w0 * q0 + w1 * q1)
+
+    return make_poses(rotations, translations)
@@ -0,0 +1,189 @@
+import logging
+import threading
+import time
+import cv2
+import numpy as np
+
+from src.config import VIEWER
+from src.streams import attach_stream, stream_layouts
+
+log = logging.getLogger(__name__)
+
+BOUNDARY = b"frame"
+
+
+def encode_jpeg(image, scale=1.0, quality=None):
+    """
+    Encodes a BGR image as JPEG bytes, resized by scale.
+    """
+    if scale != 1.0:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    success, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality or VIEWER["quality"]])
+    if not success:
+        raise Exception("Failed to encode preview")
+    return buffer.tobytes()
+
+
+def depth_colormap(depth, max_depth=0.6):
+    """
+    Colorizes a 16-bit depth image (1/10 mm) clipped at max_depth meters.
+    """
+    depth = np.minimum(depth, int(10000 * max_depth))
+    depth_8bit = cv2.normalize(depth, None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
+    return cv2.applyColorMap(depth_8bit, cv2.COLORMAP_JET)
+
+
+class RecorderSource:
+    """
+    Capture function of a FrameBroadcaster that reads the images of a running
+    recorder from its shared memory streams instead of opening the devices.
+
+    The stream is attached read-only: reading a slot is a copy guarded by the
+    seqlock of the stream, the recorder processes don't wait for or notice the
+    viewer. Frames are read at most fps times per second. If the recorder isn't
+    running, or stops writing for stale_after seconds (e.g. it was restarted),
+    the stream is attached again.
+    """
+
+    def __init__(self, stream="camera", fps=None, stale_after=2.0):
+        layouts = stream_layouts()
+        if stream not in layouts:
+            raise Exception(f"Unknown stream {stream}, available: {list(layouts)}")
+        self.name = stream
+        self.fields = layouts[stream][0]
+        self.image_fields = ("color", "depth") if stream == "camera" else ("image",)
+        self.period = 1 / (fps or VIEWER["preview_fps"])
+        self.stale_after = stale_after
+
+        self.stream = None
+        self.count = 0
+        self.updated = 0.0
+        self.deadline = time.monotonic()
+        # Frames are copied into the same arrays every time
+        self.values = {
+            field: np.empty(self.fields[field][0], dtype=self.fields[field][1])
+            for field in self.image_fields
+        }
+
+    def attach(self):
+        self.stream = attach_stream(self.name)
+        if self.stream is None:
+            return False
+        log.info(f"Attached to the {self.name} stream of the recorder")
+        self.count = 0
+        self.updated = time.monotonic()
+        return True
+
+    def detach(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+    def __call__(self):
+        self.deadline = max(self.deadline + self.period, time.monotonic())
+        time.sleep(max(self.deadline - time.monotonic(), 0))
+
+        if self.stream is None and not self.attach():
+            return None
+
+        if self.stream.count == self.count:
+            if time.monotonic() - self.updated > self.stale_after:
+                log.info(f"The {self.name} stream isn't updated anymore, attaching again")
+                self.detach()
+            return None
+
+        self.count, values = self.stream.read(self.image_fields, out=self.values)
+        self.updated = time.monotonic()
+        if self.name == "camera":
+            return np.hstack((values["color"], depth_colormap(values["depth"])))
+        return values["image"][..., :3].copy()  # the broadcaster keeps it, values are reused
+
+    def __del__(self):
+        self.detach()
+
+
+class FrameBroadcaster:
+    """
+    Publishes the latest frame of a single capture thread to any number of clients.
+
+    capture is called in a loop by the thread and returns the next BGR image (or
+    None), blocking until it is available. Every frame is encoded once at the default
+    quality, other scales and qualities requested by clients are encoded on demand
+    once per frame and shared. Clients always get the latest frame, so a slow client
+    skips frames instead of holding back the capture or the other clients.
+    """
+
+    def __init__(self, capture, quality=None):
+        self.capture = capture
+        self.quality = quality or VIEWER["quality"]
+        self.condition = threading.Condition()
+        self.sequence = 0  # number of captured frames
+        self.image = None
+        self.encoded = {}  # (scale, quality) -> JPEG bytes of the latest frame
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="preview", daemon=True)
+            self.thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            try:
+                image = self.capture()
+                if image is None:
+                    continue
+                jpeg = encode_jpeg(image, 1.0, self.quality)
+            except Exception as e:
+                log.warning(f"Preview capture failed: {e}")
+                time.sleep(0.5)
+                continue
+
+            with self.condition:
+                self.image = image
+                self.sequence += 1
+                self.encoded = {(1.0, self.quality): jpeg}
+                self.condition.notify_all()
+
+    def latest(self, scale=1.0, quality=None, after=0, timeout=1.0):
+        """
+        Waits for a frame newer than the sequence number after. Returns
+        (sequence, JPEG bytes), JPEG bytes are None after the timeout.
+        """
+        key = (scale, quality or self.quality)
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.sequence > after, timeout):
+                return after, None
+            sequence = self.sequence
+            image = self.image
+            jpeg = self.encoded.get(key)
+
+        if jpeg is None:
+            jpeg = encode_jpeg(image, *key)
+            with self.condition:
+                if self.sequence == sequence:
+                    self.encoded[key] = jpeg
+        return sequence, jpeg
+
+    def subscribe(self, fps=None, scale=1.0, quality=None):
+        """
+        Generator of a multipart/x-mixed-replace stream with at most fps frames per second.
+        The JPEG bytes are yielded as they are, shared between all clients.
+        """
+        self.start()
+        period = 1 / min(fps or VIEWER["fps"], VIEWER["fps"])
+        sequence = 0
+        deadline = time.monotonic()
+        while True:
+            sequence, jpeg = self.latest(scale, quality, after=sequence)
+            if jpeg is None:
+                continue
+            yield b"--" + BOUNDARY + b"\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n" % len(jpeg)
+            yield jpeg
+            yield b"\r\n"
+
+            deadline = max(deadline + period, time.monotonic() - period)
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                time.sleep(remaining)
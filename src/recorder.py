@@ -0,0 +1,338 @@
+import asyncio
+import logging
+import multiprocessing as mp
+import os
+import sys
+import time
+from datetime import datetime
+import numpy as np
+
+from src.config import RECORDER, DATA_DIR, ZED, GRIPPER
+from src.episode import write_episodes
+from src.scheduler import PeriodicScheduler, configure_process
+
+log = logging.getLogger(__name__)
+
+
+def read_grip(Grip, trigger_stream, stats, trigger_pipe=None):
+    """
+    Publishes the grip on the trigger stream. Changes of the trigger state are
+    also sent as (timestamp, state) to trigger_pipe if given, to wake up the
+    gripper controller without polling.
+    """
+    configure_process("grip")
+    grip = Grip()
+    last_state = None
+
+    while True:
+        _timestamp = grip.get_data()
+        if _timestamp:
+            _state = grip.get_trigger_state()
+            trigger_stream.write(
+                timestamp=_timestamp,
+                state=_state,
+                button=grip.get_button_state(),
+                device_timestamp=grip.device_timestamp,
+                lost=grip.lost_packets,
+            )
+            if trigger_pipe is not None and _state != last_state:
+                trigger_pipe.send((_timestamp, _state))
+                last_state = _state
+        stats.tick()
+
+
+def read_tracker(Tracker, pose_stream, tracker_image_stream, stats):
+    configure_process("tracker")
+    tracker = Tracker()
+    tracker.enable_tracking()
+    # grab_frame blocks until the next frame, the camera paces the loop
+    image_dt = 1/ZED["image_fps"]
+    next_image_time = 0
+    
+    while True:
+        start_time = time.monotonic()
+        if tracker.grab_frame():
+            # _pose_timestamp, _confidence, _pose = tracker.get_pose_in_ee_frame()
+            _pose_timestamp, _confidence, _pose = tracker.get_ee_pose()
+
+            pose_stream.write(
+                timestamp=_pose_timestamp, value=_pose, confidence=_confidence
+            )
+            stats.tick(staleness=time.time() - _pose_timestamp / 1e3)
+
+            # Images are only retrieved as fast as the recorder consumes them
+            if RECORDER["tracking_image"] and start_time >= next_image_time:
+                next_image_time = max(next_image_time, start_time - image_dt) + image_dt
+                _image_timestamp, image = tracker.get_image(deep_copy=False)
+
+                # Copy directly from the ZED buffer into shared memory, dropping alpha
+                index = tracker_image_stream.begin_write()
+                tracker_image_stream.arrays["timestamp"][index] = _image_timestamp
+                np.copyto(tracker_image_stream.arrays["image"][index], image[:, :, :3])
+                tracker_image_stream.end_write(index)
+        else:
+            time.sleep(1/ZED["fps"])  # grab failed without waiting for a frame
+
+
+def read_camera(Camera, camera_stream, stats):
+    configure_process("camera")
+    camera = Camera()
+
+    while True:
+        if not camera.wait_for_frames():
+            log.warning("No frames received from RealSense camera")
+            continue
+        color = camera.get_image()
+        depth = camera.get_depth()
+
+        if (color is None) or (depth is None):
+            continue
+
+        # Copy the frame data straight into the next slot of the shared memory
+        index = camera_stream.begin_write()
+        np.copyto(camera_stream.arrays["color"][index], color)
+        np.copyto(camera_stream.arrays["depth"][index], depth)
+        camera_stream.arrays["timestamp"][index] = camera.get_timestamp()
+        camera_stream.arrays["frame_number"][index] = camera.get_frame_number()
+        camera_stream.arrays["dropped"][index] = camera.dropped_frames
+        camera_stream.end_write(index)
+        stats.tick(staleness=(time.time_ns() - camera.get_timestamp()) / 1e9)
+
+
+def send_to_gripper(Gripper, trigger_stream, gripper_stream, dt, stats):
+    configure_process("gripper")
+    gripper = Gripper()
+    gripper.activate()
+    scheduler = PeriodicScheduler(dt, name="Gripper control")
+
+    while True:
+        _, trigger = trigger_stream.read()
+        # Command and state share one bus transaction, unchanged commands aren't resent
+        _gripper_state = gripper.go_to_and_get_state(int(trigger["state"]))
+        if _gripper_state is None:
+            log.error("Failed to get gripper position")
+        else:
+            gripper_stream.write(timestamp=time.time_ns(), state=_gripper_state)
+            stats.tick(staleness=(time.time_ns() - int(trigger["timestamp"])) / 1e9)
+
+        scheduler.wait()
+
+
+def control_gripper(Gripper, trigger_stream, gripper_stream, stats, trigger_pipe=None):
+    """
+    Asyncio alternative to send_to_gripper for an AsyncGripper: a changed trigger is
+    sent right away, while the state is polled independently at GRIPPER["status_frequency"],
+    so slow status reads don't delay commands. Changes are received from read_grip
+    through trigger_pipe if given, otherwise the trigger stream is checked at
+    GRIPPER["command_frequency"]. A failed command is sent again after 1 / GRIPPER["command_frequency"].
+
+    The latency from the trigger sample to the command being sent and from the
+    command to the first position change seen are recorded in stats.
+    """
+    configure_process("gripper")
+    gripper = Gripper()
+    # (trigger sample ns, command sent ns, position when sent) of the command awaiting motion
+    pending = None
+    position = None
+
+    async def send(timestamp, state):
+        """
+        Sends a command, returns False if it failed. Only sent commands are recorded in stats.
+        """
+        nonlocal pending
+        result = await gripper.go_to(state)
+        if result is None:
+            return True  # same as the last command sent
+        if not result:
+            return False
+        sent = time.time_ns()
+        stats.observe("trigger_to_command", (sent - timestamp) / 1e9)
+        if pending is None and position is not None and abs(state - position) > GRIPPER["motion_threshold"]:
+            pending = timestamp, sent, position
+        stats.tick(staleness=(time.time_ns() - timestamp) / 1e9)
+        return True
+
+    async def poll_commands():
+        period = 1 / GRIPPER["command_frequency"]
+        last_state = None
+        while True:
+            _, trigger = trigger_stream.read(fields=("timestamp", "state"))
+            # A failed command is sent again on the next check
+            if trigger["state"] != last_state and await send(int(trigger["timestamp"]), int(trigger["state"])):
+                last_state = trigger["state"]
+            await asyncio.sleep(period)
+
+    async def receive_commands():
+        period = 1 / GRIPPER["command_frequency"]
+        received = asyncio.Event()
+        gripper.loop.add_reader(trigger_pipe.fileno(), received.set)
+        unsent = None  # change whose command failed, sent again after period
+        while True:
+            if unsent is None:
+                await received.wait()
+            else:
+                try:
+                    await asyncio.wait_for(received.wait(), period)
+                except asyncio.TimeoutError:
+                    pass
+            received.clear()
+            # Only the newest change matters
+            message = unsent
+            while trigger_pipe.poll():
+                message = trigger_pipe.recv()
+            unsent = None
+            if message is not None and not await send(*message):
+                unsent = message
+
+    async def poll_state():
+        nonlocal pending, position
+        period = 1 / GRIPPER["status_frequency"]
+        deadline = gripper.loop.time()
+        while True:
+            _gripper_state = await gripper.get_state()
+            if _gripper_state is None:
+                log.error("Failed to get gripper position")
+            else:
+                now = time.time_ns()
+                gripper_stream.write(timestamp=now, state=_gripper_state)
+                position = _gripper_state
+                if pending and abs(position - pending[2]) > GRIPPER["motion_threshold"]:
+                    stats.observe("command_to_motion", (now - pending[1]) / 1e9)
+                    pending = None
+            deadline += period
+            await asyncio.sleep(max(deadline - gripper.loop.time(), 0))
+
+    async def run():
+        await gripper.activate()
+        commands = receive_commands() if trigger_pipe is not None else poll_commands()
+        await asyncio.gather(commands, poll_state())
+
+    try:
+        gripper.loop.run_until_complete(run())
+    finally:
+        gripper.close()
+
+
+def log_data(streams, dt):
+    scheduler = PeriodicScheduler(dt, busy_wait=0, name="Logging")
+    while True:
+        try:
+            _, pose = streams["pose"].read()
+            _, camera = streams["camera"].read(fields=("color",))
+            _, trigger = streams["trigger"].read()
+            pose_matrix = pose["value"]
+
+            sys.stdout.write("\r \r")
+            sys.stdout.write(
+                f"First pixel: {camera['color'][0,0]} | Trigger: {trigger['state']:2.0f} | Button: {trigger['button']:1.0f} | X: {pose_matrix[0,3]:5.1f}  Y: {pose_matrix[1,3]:5.1f} Z: {pose_matrix[2,3]:5.1f} | Confidence: {pose['confidence']:2.0f}"
+            )
+            sys.stdout.flush()
+        except Exception as e:
+            log.info("Waiting for data:" + str(e))
+
+        scheduler.wait()
+
+
+def record_data(streams, dt, stats, session_dir=None, events=None):
+    """
+    Toggles recording on button presses and sends a frame to the writer process
+    every dt. Episodes are saved in session_dir (a new session in DATA_DIR by default),
+    a ("saved", file_path, frames, seconds) event is put to events after each one.
+    The status is shown by the reporter process (src/stats.py).
+    """
+
+    recording = False
+    prev_button_state = 0
+
+    if session_dir is None:
+        session_dir = os.path.join(
+            DATA_DIR, "session_" + datetime.now().strftime("%Y%m%d_%H%M%S")
+        )
+    os.makedirs(session_dir, exist_ok=True)
+
+    # Frames are streamed to a dedicated writer process instead of being kept in memory
+    writer_queue = mp.Queue(maxsize=RECORDER["queue_size"])
+    writer_process = mp.Process(target=write_episodes, args=(writer_queue, events))
+    writer_process.start()
+    # Only after starting the writer, which shouldn't share the recorder's CPUs
+    configure_process("recorder")
+    scheduler = PeriodicScheduler(dt, name="Recording")
+
+    log.warning("### Press the button to start recording ###")
+
+    try:
+        while True:
+            _, trigger = streams["trigger"].read()
+            _, pose = streams["pose"].read()
+            current_button_state = trigger["button"]
+            latest_pose_confidence = pose["confidence"]
+            staleness = None
+            
+            if prev_button_state == 0 and current_button_state == 1:
+                recording = not recording  # Toggle on button press
+
+                if recording:
+                    log.info("Started recording")
+                    initial_pose = pose["value"]
+                    initial_pose_inv = np.linalg.inv(initial_pose)
+
+                    episode_timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                    writer_queue.put(
+                        ("open", f"{session_dir}/episode_{episode_timestamp}.h5")
+                    )
+
+                else:
+                    log.info("Stopped recording")
+                    writer_queue.put(("close", time.monotonic()))
+
+                    log.warning("### Press the button to start recording ###")
+
+            prev_button_state = current_button_state
+
+            if recording:
+                # Retrieve values
+                timestamp = time.time_ns()  # round(time.time() * 1000)
+                # log.info(f"Recording frame {timestamp}")
+
+                _, gripper = streams["gripper"].read()
+                _, camera = streams["camera"].read()
+
+                latest_pose_matrix = pose["value"]
+                # Poses recorded are relative to the initial pose
+                if initial_pose is not None:
+                    relative_pose_matrix = initial_pose_inv @ latest_pose_matrix
+
+                frame = {
+                    "timestamps": timestamp,
+                    "trigger_timestamps": trigger["timestamp"],
+                    "trigger_states": trigger["state"],
+                    "gripper_timestamps": gripper["timestamp"],
+                    "gripper_states": gripper["state"],
+                    "image_timestamps": camera["timestamp"],
+                    "image_frame_numbers": camera["frame_number"],
+                    "color_images": camera["color"],
+                    "depth_images": camera["depth"],
+                    "pose_timestamps": pose["timestamp"],
+                    "pose_values": relative_pose_matrix,
+                    # "pose_values": latest_pose_matrix,
+                    "pose_confidences": latest_pose_confidence,
+                }
+
+                if RECORDER["tracking_image"]:
+                    _, tracker_image = streams["tracker_image"].read(fields=("image",))
+                    frame["tracker_images"] = tracker_image["image"]
+
+                writer_queue.put(("frame", frame))
+                staleness = (timestamp - int(camera["timestamp"])) / 1e9
+
+            stats.tick(staleness=staleness)
+
+            scheduler.wait()
+
+    except KeyboardInterrupt:
+        print("Aborting recording...")
+
+    finally:
+        # The writer closes an unfinished episode before it exits
+        writer_queue.put(None)
+        writer_process.join()
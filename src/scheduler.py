@@ -0,0 +1,95 @@
+import logging
+import os
+import time
+
+from src.config import SCHEDULER
+
+log = logging.getLogger(__name__)
+
+
+class PeriodicScheduler:
+    """
+    Paces a loop at a fixed period on absolute deadlines of the monotonic clock,
+    so that overruns and sleep inaccuracy don't accumulate into drift.
+
+    The loop calls wait() at the end of every iteration. It sleeps until shortly
+    before the next deadline and spins for the last busy_wait seconds, because
+    time.sleep often wakes up late by a fraction of a millisecond.
+
+    Missed deadlines are handled according to missed_ticks:
+      "skip": continue with the next deadline in the future, keeping the phase
+      "catch_up": run the missed iterations back to back without sleeping
+    """
+
+    def __init__(self, period, busy_wait=None, missed_ticks=None, name="loop"):
+        busy_wait = SCHEDULER["busy_wait"] if busy_wait is None else busy_wait
+        missed_ticks = missed_ticks or SCHEDULER["missed_ticks"]
+        if missed_ticks not in ("skip", "catch_up"):
+            raise Exception(f"Unknown missed ticks policy: {missed_ticks}")
+
+        self.period = period
+        self.busy_wait = busy_wait
+        self.missed_ticks = missed_ticks
+        self.name = name
+        self.deadline = time.monotonic()
+        self.missed = 0  # total number of missed deadlines
+        self._counted_until = self.deadline  # last missed deadline already counted
+
+    def wait(self):
+        """
+        Blocks until the next deadline, returns the number of deadlines missed since the last call.
+        """
+        self.deadline += self.period
+        now = time.monotonic()
+
+        missed = 0
+        if now > self.deadline:
+            behind = int((now - self.deadline) // self.period) + 1
+            # While catching up, the same deadlines are passed again by the following calls
+            counted = max(0, round((self._counted_until - self.deadline) / self.period) + 1)
+            missed = max(behind - counted, 0)
+            self._counted_until = max(self._counted_until, self.deadline + (behind - 1) * self.period)
+            if missed:
+                self.missed += missed
+                log.debug(
+                    f"{self.name} loop missed {missed} deadline(s) of {self.period:.4f} seconds"
+                )
+            if self.missed_ticks == "catch_up":
+                return missed
+            self.deadline += behind * self.period
+
+        remaining = self.deadline - now - self.busy_wait
+        if remaining > 0:
+            time.sleep(remaining)
+        while time.monotonic() < self.deadline:
+            pass
+
+        return missed
+
+
+def configure_process(name):
+    """
+    Applies the CPU affinity and real-time priority of SCHEDULER to the calling process.
+    Child processes started afterwards inherit the affinity, but not the priority.
+    """
+    cpus = SCHEDULER["cpus"].get(name)
+    if cpus:
+        try:
+            os.sched_setaffinity(0, cpus)
+            log.info(f"Pinned {name} process to CPUs {sorted(cpus)}")
+        except (AttributeError, OSError) as e:
+            log.warning(f"Could not pin {name} process to CPUs {cpus}: {e}")
+
+    priority = SCHEDULER["fifo_priority"].get(name)
+    if priority:
+        try:
+            # Forked children (e.g. the episode writer) fall back to normal scheduling
+            os.sched_setscheduler(
+                0, os.SCHED_FIFO | os.SCHED_RESET_ON_FORK, os.sched_param(priority)
+            )
+            log.info(f"Running {name} process with SCHED_FIFO priority {priority}")
+        except (AttributeError, OSError) as e:
+            log.warning(
+                f"Could not set SCHED_FIFO priority {priority} for {name} process "
+                f"(requires CAP_SYS_NICE or an rtprio limit): {e}"
+            )
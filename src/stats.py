@@ -0,0 +1,248 @@
+import json
+import logging
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+from src.config import STATS
+from src.streams import Stream
+
+log = logging.getLogger(__name__)
+
+LOOPS = ("grip", "tracker", "camera", "gripper", "recorder")
+# Upper bounds of the histogram buckets in seconds, the last one catches everything.
+# Bounds near the loop periods (200, 60 and 30 Hz) lie just above them, so that an
+# iteration on time is counted below the bound and an overrun above it.
+BUCKETS = np.array(
+    [0.0005, 0.001, 0.002, 0.0055, 0.01, 0.017, 0.02, 0.034, 0.04, 0.05, 0.1, 0.2, 0.5, 1.0, np.inf]
+)
+HISTOGRAMS = ("iteration", "staleness")
+# Additional histograms of single loops
+LOOP_HISTOGRAMS = {
+    # Trigger sample to command sent, command sent to the fingers moving (control_gripper)
+    "gripper": ("trigger_to_command", "command_to_motion"),
+}
+
+
+def stats_fields(histograms=HISTOGRAMS):
+    fields = {}
+    for histogram in histograms:
+        fields[f"{histogram}_buckets"] = ((len(BUCKETS),), "uint64")
+        fields[f"{histogram}_sum"] = ((), "float64")
+        fields[f"{histogram}_count"] = ((), "uint64")
+    return fields
+
+
+class LoopStats:
+    """
+    Histograms of the iteration time (start to start) and the staleness (age of the
+    data handled in the iteration) of a process loop, published in shared memory.
+    Only the owning loop writes, so counting is just a local update and one seqlock write.
+    Loops in LOOP_HISTOGRAMS have further histograms, updated with observe().
+    """
+
+    def __init__(self, name, create=False):
+        self.name = name
+        self.histograms = HISTOGRAMS + LOOP_HISTOGRAMS.get(name, ())
+        fields = stats_fields(self.histograms)
+        self.stream = Stream(f"stats_{name}", fields, slots=2, create=create)
+        self.values = {
+            field: np.zeros(shape, dtype=dtype) for field, (shape, dtype) in fields.items()
+        }
+        self.last_tick = None
+
+    def __getstate__(self):
+        return self.name, self.stream
+
+    def __setstate__(self, state):
+        self.name, self.stream = state
+        self.histograms = HISTOGRAMS + LOOP_HISTOGRAMS.get(self.name, ())
+        self.values = {
+            field: np.zeros(shape, dtype=dtype)
+            for field, (shape, dtype) in stats_fields(self.histograms).items()
+        }
+        self.last_tick = None
+
+    def _observe(self, histogram, value):
+        self.values[f"{histogram}_buckets"][np.searchsorted(BUCKETS, value)] += 1
+        self.values[f"{histogram}_sum"] += value
+        self.values[f"{histogram}_count"] += 1
+
+    def observe(self, histogram, value):
+        """
+        Adds a value in seconds to one of the additional histograms of the loop.
+        """
+        self._observe(histogram, max(value, 0))
+        self.stream.write(**self.values)
+
+    def tick(self, staleness=None):
+        """
+        Call once per loop iteration, with the age of the handled data in seconds if known.
+        """
+        now = time.perf_counter()
+        if self.last_tick is not None:
+            self._observe("iteration", now - self.last_tick)
+        self.last_tick = now
+        if staleness is not None:
+            self._observe("staleness", max(staleness, 0))
+        self.stream.write(**self.values)
+
+    def read(self):
+        _, values = self.stream.read()
+        return values
+
+    def close(self):
+        self.stream.close()
+
+
+def open_stats(create=False):
+    return {name: LoopStats(name, create=create) for name in LOOPS}
+
+
+def close_stats(stats):
+    for loop_stats in stats.values():
+        loop_stats.close()
+
+
+def quantile(buckets, q):
+    """
+    Upper bound of the bucket containing quantile q, nan without observations and
+    inf above the last finite bound.
+    """
+    total = buckets.sum()
+    if total == 0:
+        return np.nan
+    return BUCKETS[np.searchsorted(np.cumsum(buckets), q * total)]
+
+
+def _bound(value):
+    # JSON has no infinity, quantiles above the last finite bound are None
+    return float(value) if np.isfinite(value) else None
+
+
+def _format_ms(value):
+    return f"{value * 1000:.0f}" if value is not None else f">{BUCKETS[-2] * 1000:.0f}"
+
+
+def summarize(stats):
+    """
+    Returns {loop: {histogram: {count, mean, p50, p99, buckets}}} as plain Python types.
+    Quantiles are None without observations or above the last finite bucket bound.
+    """
+    summary = {}
+    for name, loop_stats in stats.items():
+        values = loop_stats.read()
+        summary[name] = {}
+        for histogram in loop_stats.histograms:
+            buckets = values[f"{histogram}_buckets"]
+            count = int(values[f"{histogram}_count"])
+            summary[name][histogram] = {
+                "count": count,
+                "mean": float(values[f"{histogram}_sum"]) / count if count else None,
+                "p50": _bound(quantile(buckets, 0.5)) if count else None,
+                "p99": _bound(quantile(buckets, 0.99)) if count else None,
+                "buckets": {
+                    ("+Inf" if np.isinf(le) else str(le)): int(n)
+                    for le, n in zip(BUCKETS, np.cumsum(buckets))
+                },
+            }
+    return summary
+
+
+def prometheus_text(stats):
+    """
+    Returns all histograms in the Prometheus text exposition format.
+    """
+    lines = []
+    histograms = dict.fromkeys(h for loop_stats in stats.values() for h in loop_stats.histograms)
+    for histogram in histograms:
+        metric = f"di_loop_{histogram}_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        for name, loop_stats in stats.items():
+            if histogram not in loop_stats.histograms:
+                continue
+            values = loop_stats.read()
+            cumulative = np.cumsum(values[f"{histogram}_buckets"])
+            for le, count in zip(BUCKETS, cumulative):
+                le = "+Inf" if np.isinf(le) else f"{le:g}"
+                lines.append(f'{metric}_bucket{{loop="{name}",le="{le}"}} {count}')
+            lines.append(f'{metric}_sum{{loop="{name}"}} {values[f"{histogram}_sum"]:.6f}')
+            lines.append(f'{metric}_count{{loop="{name}"}} {values[f"{histogram}_count"]}')
+    return "\n".join(lines) + "\n"
+
+
+def serve_metrics(stats, port):
+    """
+    Serves prometheus_text at http://0.0.0.0:port/metrics from a daemon thread.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = prometheus_text(stats).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    log.info(f"Serving loop statistics at http://0.0.0.0:{port}/metrics")
+    return server
+
+
+def confidence_color(value):
+    if value >= 80:
+        return '\033[92m'  # Green
+    elif value >= 60:
+        return '\033[93m'  # Yellow
+    else:
+        return '\033[91m'  # Red
+
+
+def report_stats(stats, streams, interval=STATS["report_interval"]):
+    """
+    Target of the reporter process: shows the status line, serves the metrics
+    endpoint (STATS["port"]) and dumps the statistics to STATS["json_path"], all at
+    a low rate and outside the hot loops.
+    """
+    if STATS["port"]:
+        serve_metrics(stats, STATS["port"])
+
+    try:
+        while True:
+            _, pose = streams["pose"].read(fields=("confidence",))
+            _, camera = streams["camera"].read(fields=("dropped",))
+            _, trigger = streams["trigger"].read(fields=("lost",))
+            summary = summarize(stats)
+
+            confidence = pose["confidence"]
+            loops = " ".join(
+                f"{name}: {_format_ms(summary[name]['iteration']['p99'])}"
+                for name in LOOPS
+                if summary[name]["iteration"]["count"]
+            )
+            sys.stdout.write('\r')
+            sys.stdout.write(
+                f"{confidence_color(confidence)}##### Pose Confidence: {confidence:2.0f} ######\033[0m"
+                f" | Dropped frames: {camera['dropped']} | Lost packets: {trigger['lost']}"
+                f" | p99 loop ms {loops}"
+            )
+            sys.stdout.flush()
+
+            if STATS["json_path"]:
+                with open(STATS["json_path"], "w") as f:
+                    json.dump({"time": time.time(), "loops": summary}, f)
+
+            time.sleep(interval)
+
+    except KeyboardInterrupt:
+        pass
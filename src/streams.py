@@ -0,0 +1,269 @@
+import logging
+import mmap
+import platform
+import zlib
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+from src.config import RECORDER, REALSENSE, ZED
+
+log = logging.getLogger(__name__)
+
+PREFIX = "di"  # shared memory blocks are named PREFIX_<stream>
+ALIGNMENT = 64  # byte alignment of every field (cache line)
+X86 = ("x86_64", "amd64", "i386", "i686", "x86")
+CHECKSUMS = (
+    platform.machine().lower() not in X86
+    if RECORDER["stream_checksums"] is None
+    else RECORDER["stream_checksums"]
+)
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class Stream:
+    """
+    Fixed-layout record in shared memory with a single writer and any number of readers.
+
+    The record is stored in a ring of slots. Every slot is guarded by a seqlock: the
+    writer makes the slot's sequence odd while writing and even again once it's
+    consistent. A reader copies the latest slot and retries if the sequence changed
+    in the meantime, so it never sees a half-written frame and never blocks the writer.
+
+    There are no memory barriers, Python has none. The seqlock relies on x86, which
+    doesn't reorder stores with other stores or loads with other loads. Other CPUs
+    (e.g. the ARM of a Jetson) may make the sequence visible before the values, so
+    with checksums (CHECKSUMS, RECORDER["stream_checksums"]) the writer also stores a
+    CRC-32 of every field of the slot and the reader retries until its copy matches.
+
+    Layout: [count, seq_0, ..., seq_n-1, crc_0_0, ..., crc_n-1_m-1] (uint64) followed
+    by one array per field of shape (slots, *shape). count is the number of completed
+    writes, crc_i_j the checksum of field j in slot i.
+    """
+
+    def __init__(self, name, fields, slots=2, create=False):
+        self.name = name
+        self.fields = fields  # {name: (shape, dtype)}
+        self.slots = slots
+
+        offsets = {}
+        size = _align(8 * (1 + slots * (1 + len(fields))))
+        for field, (shape, dtype) in fields.items():
+            offsets[field] = size
+            size = _align(
+                size + slots * int(np.prod(shape, dtype=np.int64)) * np.dtype(dtype).itemsize
+            )
+
+        shm_name = f"{PREFIX}_{name}"
+        if create:
+            try:
+                self.shm = shared_memory.SharedMemory(shm_name, create=True, size=size)
+            except FileExistsError:
+                log.warning(f"Removing stale shared memory {shm_name}")
+                shared_memory.SharedMemory(shm_name).unlink()
+                self.shm = shared_memory.SharedMemory(shm_name, create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(shm_name)
+            # Attaching registers the block with this process' resource tracker, which
+            # would unlink it at exit although it's owned by the creating process
+            resource_tracker.unregister(self.shm._name, "shared_memory")
+            # Some systems round the size up to whole pages
+            if self.shm.size not in (size, -(-size // mmap.PAGESIZE) * mmap.PAGESIZE):
+                actual = self.shm.size
+                self.shm.close()
+                raise Exception(
+                    f"Shared memory {shm_name} has {actual} bytes instead of {size}, "
+                    "the recorder was started with a different configuration"
+                )
+        self.owner = create
+
+        self.header = np.ndarray((1 + slots * (1 + len(fields)),), dtype=np.uint64, buffer=self.shm.buf)
+        self.checksums = self.header[1 + slots:].reshape(slots, len(fields))
+        self.field_index = {field: i for i, field in enumerate(fields)}
+        self.arrays = {
+            field: np.ndarray(
+                (slots,) + tuple(shape), dtype=dtype, buffer=self.shm.buf, offset=offsets[field]
+            )
+            for field, (shape, dtype) in fields.items()
+        }
+        if create:
+            self.header[:] = 0
+            for array in self.arrays.values():
+                array.fill(0)
+
+    def __getstate__(self):
+        return self.name, self.fields, self.slots
+
+    def __setstate__(self, state):
+        name, fields, slots = state
+        self.__init__(name, fields, slots, create=False)
+
+    @property
+    def count(self):
+        """
+        Number of completed writes, usable as sequence number of the latest record.
+        """
+        return int(self.header[0])
+
+    def begin_write(self):
+        """
+        Marks the next slot as being written and returns its index. Values can then be
+        written directly into self.arrays[field][index] before calling end_write.
+        """
+        index = self.count % self.slots
+        self.header[1 + index] += 1  # odd: write in progress
+        return index
+
+    def end_write(self, index):
+        if CHECKSUMS:
+            for field, i in self.field_index.items():
+                self.checksums[index, i] = zlib.crc32(self.arrays[field][index])
+        self.header[1 + index] += 1  # even: slot consistent
+        self.header[0] += 1
+
+    def write(self, **values):
+        index = self.begin_write()
+        for field, value in values.items():
+            self.arrays[field][index] = value
+        self.end_write(index)
+
+    def read(self, fields=None, out=None):
+        """
+        Returns (count, {field: value}) with a consistent copy of the latest record.
+        Copies go into the arrays of out if given. Before the first write all values are 0.
+        With CHECKSUMS, a copy that doesn't match the checksums of the slot is read again.
+        """
+        fields = fields or self.fields.keys()
+        values = out if out is not None else {}
+
+        while True:
+            count = self.count
+            index = (count - 1) % self.slots if count else 0
+            seq = self.header[1 + index]
+            if seq & 1:
+                continue
+
+            for field in fields:
+                if field in values and isinstance(values[field], np.ndarray):
+                    np.copyto(values[field], self.arrays[field][index])
+                else:
+                    values[field] = self.arrays[field][index].copy()
+
+            if CHECKSUMS and count and not self._verify(index, fields, values):
+                continue
+            if self.header[1 + index] == seq:
+                return count, values
+
+    def _verify(self, index, fields, values):
+        return all(
+            zlib.crc32(np.ascontiguousarray(values[field], dtype=self.fields[field][1])) == self.checksums[index, self.field_index[field]]
+            for field in fields
+        )
+
+    def close(self):
+        # Views have to be released before the memory can be unmapped
+        self.header = None
+        self.checksums = None
+        self.arrays = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def stream_layouts():
+    """
+    Returns {stream name: (fields, slots)} of all streams shared by the recorder processes.
+    """
+    layouts = {
+        "trigger": (
+            {
+                "timestamp": ((), "uint64"),
+                "state": ((), "uint8"),
+                "button": ((), "uint8"),
+                "device_timestamp": ((), "uint64"),
+                "lost": ((), "uint64"),
+            },
+            2,
+        ),
+        "gripper": (
+            {
+                "timestamp": ((), "uint64"),
+                "state": ((), "uint8"),
+            },
+            2,
+        ),
+        "pose": (
+            {
+                "timestamp": ((), "uint64"),
+                "value": ((4, 4), "float64"),
+                "confidence": ((), "uint8"),
+            },
+            2,
+        ),
+        "camera": (
+            {
+                "timestamp": ((), "uint64"),
+                "frame_number": ((), "uint64"),
+                "dropped": ((), "uint64"),
+                "color": (
+                    (REALSENSE["color_height"], REALSENSE["color_width"], 3),
+                    "uint8",
+                ),
+                "depth": (
+                    (REALSENSE["depth_height"], REALSENSE["depth_width"]),
+                    "uint16",
+                ),
+            },
+            3,
+        ),
+    }
+    if RECORDER["tracking_image"]:
+        layouts["tracker_image"] = (
+            {
+                "timestamp": ((), "uint64"),
+                "image": ((ZED["image_height"], ZED["image_width"], 3), "uint8"),
+            },
+            3,
+        )
+
+    return layouts
+
+
+def open_streams(create=False):
+    """
+    Creates (or attaches to) all streams of the recorder, returns {name: Stream}.
+    """
+    return {
+        name: Stream(name, fields, slots, create=create)
+        for name, (fields, slots) in stream_layouts().items()
+    }
+
+
+_mismatched = set()  # streams whose layout mismatch was logged
+
+
+def attach_stream(name):
+    """
+    Attaches read-only to a stream of a running recorder, returns None if it doesn't
+    exist or doesn't match the layout of this configuration.
+    """
+    fields, slots = stream_layouts()[name]
+    try:
+        stream = Stream(name, fields, slots, create=False)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        # Attaching is retried periodically, the mismatch is only logged once
+        if name not in _mismatched:
+            log.warning(e)
+            _mismatched.add(name)
+        return None
+    _mismatched.discard(name)
+    return stream
+
+
+def close_streams(streams):
+    for stream in streams.values():
+        stream.close()
@@ -0,0 +1,153 @@
+import json
+import logging
+import threading
+import time
+import numpy as np
+
+from src.config import TELEMETRY
+from src.poses import matrix_to_quaternion
+from src.scheduler import PeriodicScheduler
+from src.streams import attach_stream
+
+log = logging.getLogger(__name__)
+
+# Little-endian, packed record of a telemetry sample, see web_viewer/static/telemetry.js
+RECORD = np.dtype(
+    [
+        ("time", "<f8"),  # seconds since the epoch, when the sample was taken
+        ("position", "<f4", (3,)),  # pose translation
+        ("quaternion", "<f4", (4,)),  # pose rotation [x, y, z, w]
+        ("confidence", "u1"),
+        ("trigger", "u1"),
+        ("gripper", "u1"),
+    ]
+)
+STREAMS = ("pose", "trigger", "gripper")
+
+
+def record_format():
+    """
+    Description of RECORD for the clients: {"record_size": bytes, "fields": {name: [offset, type, count]}}.
+    """
+    fields = {}
+    for name in RECORD.names:
+        dtype, offset = RECORD.fields[name]
+        base = dtype.base if dtype.subdtype else dtype
+        count = int(np.prod(dtype.shape)) if dtype.shape else 1
+        fields[name] = [offset, base.str.lstrip("<|"), count]
+    return {"record_size": RECORD.itemsize, "fields": fields}
+
+
+class TelemetrySampler:
+    """
+    Samples the pose, trigger and gripper state of a running recorder in a single
+    thread, from the latest records of its shared memory streams. The recorder
+    processes don't send anything, the viewer only copies the records at up to
+    TELEMETRY["frequency"] and only keeps samples in which one of the streams changed.
+
+    Clients get all samples since their last batch as packed RECORD bytes, so a
+    message carries several samples and slow clients lose none within the history.
+    """
+
+    def __init__(self, frequency=None, history=None, stale_after=2.0):
+        self.period = 1 / (frequency or TELEMETRY["frequency"])
+        self.records = np.zeros(history or TELEMETRY["history"], dtype=RECORD)
+        self.stale_after = stale_after
+
+        self.count = 0  # number of samples taken
+        self.condition = threading.Condition()
+        self.thread = None
+
+        self.streams = {}
+        self.stream_counts = {name: 0 for name in STREAMS}
+        self.updated = time.monotonic()
+        self.values = {
+            "pose": {"value": np.eye(4), "confidence": np.zeros((), np.uint8)},
+            "trigger": {"state": np.zeros((), np.uint8)},
+            "gripper": {"state": np.zeros((), np.uint8)},
+        }
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="telemetry", daemon=True)
+            self.thread.start()
+        return self
+
+    def _run(self):
+        scheduler = PeriodicScheduler(self.period, busy_wait=0, name="telemetry")
+        attach_deadline = 0.0
+        while True:
+            if len(self.streams) < len(STREAMS) and time.monotonic() > attach_deadline:
+                self.attach()
+                attach_deadline = time.monotonic() + 1.0
+            try:
+                self.sample()
+            except Exception as e:
+                log.warning(f"Telemetry sampling failed: {e}")
+                self.detach()
+            scheduler.wait()
+
+    def attach(self):
+        for name in STREAMS:
+            if name not in self.streams:
+                stream = attach_stream(name)
+                if stream is not None:
+                    self.streams[name] = stream
+                    self.stream_counts[name] = 0
+                    self.updated = time.monotonic()
+                    log.info(f"Attached to the {name} stream of the recorder")
+
+    def detach(self):
+        for stream in self.streams.values():
+            stream.close()
+        self.streams = {}
+
+    def sample(self):
+        changed = False
+        for name, stream in self.streams.items():
+            if stream.count != self.stream_counts[name]:
+                self.stream_counts[name], _ = stream.read(self.values[name].keys(), out=self.values[name])
+                changed = True
+
+        if not changed:
+            if self.streams and time.monotonic() - self.updated > self.stale_after:
+                log.info("The recorder streams aren't updated anymore, attaching again")
+                self.detach()
+            return
+        self.updated = time.monotonic()
+
+        pose = self.values["pose"]["value"]
+        record = self.records[self.count % len(self.records)]
+        record["time"] = time.time()
+        record["position"] = pose[:3, 3]
+        record["quaternion"] = matrix_to_quaternion(pose[:3, :3])
+        record["confidence"] = self.values["pose"]["confidence"]
+        record["trigger"] = self.values["trigger"]["state"]
+        record["gripper"] = self.values["gripper"]["state"]
+
+        with self.condition:
+            self.count += 1
+            self.condition.notify_all()
+
+    def batches(self, interval=None):
+        """
+        Generator of the packed records taken since the previous batch, at most one
+        batch per interval seconds. Samples older than the history are skipped.
+        """
+        self.start()
+        interval = interval or TELEMETRY["batch_interval"]
+        sent = self.count
+        while True:
+            time.sleep(interval)
+            with self.condition:
+                if not self.condition.wait_for(lambda: self.count > sent, timeout=1.0):
+                    continue
+                count = self.count
+                # The oldest slot is the next one to be overwritten
+                first = max(sent, count - len(self.records) + 1)
+                data = self.records[np.arange(first, count) % len(self.records)].tobytes()
+            sent = count
+            yield data
+
+    def header(self):
+        return json.dumps(dict(record_format(), frequency=1 / self.period))
@@ -1,7 +1,11 @@
 import logging
 import numpy as np
-import pandas as pd
 from scipy.interpolate import interp1d
+from scipy.optimize import minimize_scalar
+from scipy.signal import correlate
+
+from src.poses import make_poses, kabsch, kabsch_rotation, compose, interpolate
+from src.vicon import load_vicon, fill_occlusions
 
 
 class CustomFormatter(logging.Formatter):
@@ -36,53 +40,20 @@ class CustomFormatter(logging.Formatter):
 
 
 def compute_rotation_matrix(A, B):
-    H = A.T @ B
-    U, S, Vt = np.linalg.svd(H)
-    R = Vt.T @ U.T
-    if np.linalg.det(R) < 0:
-        Vt[-1, :] *= -1
-        R = Vt.T @ U.T
-    return R
-
-def poses_from_vicon(file):
+    """
+    Rotation best mapping the points A onto B (M, 3), also for stacks (N, M, 3).
+    """
+    return kabsch_rotation(A, B)
 
-    data = pd.read_csv(file, skiprows=5, header=0)
-    
-    # Rename columns for better understanding
-    columns = [
-        'Frame', 'X1', 'Y1', 'Z1', 'X2', 'Y2', 'Z2',
-        'X3', 'Y3', 'Z3', 'X4', 'Y4', 'Z4', 'X5', 'Y5', 'Z5',
-        'Mag_X1', 'Mag_Y1', 'Mag_Z1', 'Mag_X2', 'Mag_Y2', 'Mag_Z2'
-    ]
-    data.columns = columns
-
-    # Extract marker coordinates
-    marker_columns = ['X1', 'Y1', 'Z1', 'X2', 'Y2', 'Z2', 'X3', 'Y3', 'Z3', 'X4', 'Y4', 'Z4', 'X5', 'Y5', 'Z5']
-    markers = data[marker_columns].values
-    markers = markers.reshape(-1, 5, 3)
-
-    # Calculate the centroid (center of the rigid body)
-    centroid = np.mean(markers, axis=1)
-
-    # Define a reference frame using the initial positions of the markers
-    reference_markers = markers[0]
-
-    # Compute the rotation matrix for each frame
-    rotation_matrices = []
-    for i in range(markers.shape[0]):
-        R_i = compute_rotation_matrix(reference_markers, markers[i])
-        rotation_matrices.append(R_i)
-
-    rotation_matrices = np.array(rotation_matrices)
-    
-    poses = np.zeros((len(centroid), 4, 4))
-    for i in range(len(centroid)):
-        poses[i] = np.eye(4)
-        poses[i, :3, :3] = rotation_matrices[i]
-        poses[i, :3, 3] = centroid[i]/1000 # to meter
-        
-        
-    return poses
+def poses_from_vicon(file, markers=None):
+    """
+    Poses (N, 4, 4) of the rigid body formed by the markers (VICON["markers"] by default)
+    of a Vicon CSV export: the centroid in meters and the rotation relative to the first
+    complete frame. Frames with occluded markers are interpolated, so the poses can be
+    resampled. Parsed once and then loaded from a cache, see src/vicon.py.
+    """
+    _, poses = load_vicon(file, markers)
+    return fill_occlusions(poses)
 
 
 def plot_pose(ax, translation, rotation):
@@ -128,53 +99,102 @@ def set_axes_equal(ax):
 ############################# 
 
 def compute_transformation_matrix(estimated_poses, ground_truth_poses):
+    """
+    Rotation and translation best aligning the estimated positions with the ground truth.
+    """
     assert estimated_poses.shape == ground_truth_poses.shape
-    N = estimated_poses.shape[0]
 
-    # Extract translation components
-    t_estimated = estimated_poses[:, :3, 3]
-    t_ground_truth = ground_truth_poses[:, :3, 3]
+    # Align the translation components
+    transformation = kabsch(estimated_poses[:, :3, 3], ground_truth_poses[:, :3, 3])
+
+    return transformation[:3, :3], transformation[:3, 3]
+
+def apply_transformation(estimated_poses, R_optimal, t_optimal):
+    """
+    Applies the transformation (R_optimal, t_optimal) to all poses at once.
+    """
+    transformed_poses = compose(make_poses(R_optimal, t_optimal), estimated_poses)
+    # Homogeneous component remains [0, 0, 0, 1]
+    transformed_poses[:, 3, :] = [0, 0, 0, 1]
+
+    return transformed_poses
 
-    # Extract rotation components
-    R_estimated = estimated_poses[:, :3, :3]
-    R_ground_truth = ground_truth_poses[:, :3, :3]
+def alignment_errors(estimated_poses, ground_truth_poses):
+    """
+    RMSE of the positions after the optimal rigid alignment, for every offset of the
+    estimated trajectory (N) into the longer ground truth (M >= N). Returns (M - N + 1,).
 
-    # Compute centroids
-    centroid_t_estimated = np.mean(t_estimated, axis=0)
-    centroid_t_ground_truth = np.mean(t_ground_truth, axis=0)
+    The cross-covariances of all offsets are computed as cross-correlations and the
+    residual follows in closed form from their singular values, so no offset is
+    aligned explicitly.
+    """
+    p = estimated_poses[:, :3, 3]
+    v = ground_truth_poses[:, :3, 3]
+    N = len(p)
+    assert len(v) >= N
+
+    p = p - p.mean(axis=0)
+    v = v - v.mean(axis=0)  # doesn't change the covariances, improves the precision
+
+    # H[k] = sum_i p_i v_(i+k)^T, the mean of v drops out since p is centered
+    H = np.stack(
+        [
+            np.stack([correlate(v[:, b], p[:, a], mode="valid") for b in range(3)], axis=-1)
+            for a in range(3)
+        ],
+        axis=-2,
+    )
 
-    # Center the data
-    t_estimated_centered = t_estimated - centroid_t_estimated
-    t_ground_truth_centered = t_ground_truth - centroid_t_ground_truth
+    # Spread of every window of v around its own mean
+    def window_sums(x):
+        cumsum = np.concatenate([np.zeros((1,) + x.shape[1:]), np.cumsum(x, axis=0)])
+        return cumsum[N:] - cumsum[:-N]
 
-    # Compute H matrix
-    H = t_estimated_centered.T @ t_ground_truth_centered
+    v_sums = window_sums(v)
+    v_spread = window_sums(np.sum(v**2, axis=1)) - np.sum(v_sums**2, axis=1) / N
 
-    # SVD
-    U, S, Vt = np.linalg.svd(H)
-    R_optimal = Vt.T @ U.T
+    # Kabsch: the optimal rotation attains the sum of the singular values, with the
+    # smallest one negated where the solution would otherwise be a reflection
+    singular_values = np.linalg.svd(H, compute_uv=False)
+    singular_values[:, -1] *= np.where(np.linalg.det(H) < 0, -1, 1)
 
-    if np.linalg.det(R_optimal) < 0:
-        Vt[-1, :] *= -1
-        R_optimal = Vt.T @ U.T
+    residuals = np.sum(p**2) + v_spread - 2 * singular_values.sum(axis=1)
+    return np.sqrt(np.maximum(residuals, 0) / N)
 
-    t_optimal = centroid_t_ground_truth - R_optimal @ centroid_t_estimated
 
-    return R_optimal, t_optimal
+def align_trajectories(estimated_poses, ground_truth_poses, subframe=True):
+    """
+    Finds the offset of the estimated trajectory (N) in the longer ground truth (M >= N)
+    and the rigid transformation best aligning both.
+    The best offset is searched over all offsets at once (alignment_errors) and then
+    refined to a fraction of a frame by interpolating the ground truth if subframe.
 
-def apply_transformation(estimated_poses, R_optimal, t_optimal):
-    N = estimated_poses.shape[0]
-    transformed_poses = np.zeros_like(estimated_poses)
-    
-    for i in range(N):
-        # Apply rotation
-        transformed_poses[i, :3, :3] = R_optimal @ estimated_poses[i, :3, :3]
-        # Apply translation
-        transformed_poses[i, :3, 3] = R_optimal @ estimated_poses[i, :3, 3] + t_optimal
-        # Homogeneous component remains 1
-        transformed_poses[i, 3, 3] = 1.0
+    Returns (offset, R_optimal, t_optimal, ground truth poses at the offset (N, 4, 4)).
+    """
+    errors = alignment_errors(estimated_poses, ground_truth_poses)
+    offset = int(np.argmin(errors))
+    N = len(estimated_poses)
+
+    def cropped(offset):
+        return interpolate(ground_truth_poses, offset + np.arange(N))
+
+    if subframe and len(errors) > 1:
+        def error(offset):
+            cropped_poses = cropped(offset)
+            R, t = compute_transformation_matrix(estimated_poses, cropped_poses)
+            aligned = apply_transformation(estimated_poses, R, t)
+            return np.sqrt(np.mean(np.sum((aligned[:, :3, 3] - cropped_poses[:, :3, 3])**2, axis=1)))
+
+        bounds = (max(offset - 1, 0), min(offset + 1, len(errors) - 1))
+        result = minimize_scalar(error, bounds=bounds, method="bounded", options={"xatol": 1e-3})
+        if result.fun < errors[offset]:
+            offset = float(result.x)
+
+    ground_truth = cropped(offset) if subframe else ground_truth_poses[offset:offset + N]
+    R_optimal, t_optimal = compute_transformation_matrix(estimated_poses, ground_truth)
+
+    return offset, R_optimal, t_optimal, ground_truth
 
-    return transformed_poses
 
 def compute_ate(estimated_poses, ground_truth_poses):
     # Calculate the Euclidean distance between corresponding positions
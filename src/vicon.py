@@ -0,0 +1,195 @@
+import csv
+import hashlib
+import logging
+import os
+import numpy as np
+import pandas as pd
+
+from src.config import VICON
+from src.poses import interpolate, kabsch_rotation, make_poses
+
+log = logging.getLogger(__name__)
+
+CACHE_VERSION = 1  # bump when the cached arrays change
+UNITS = {"mm": 1e-3, "cm": 1e-2, "m": 1.0}
+
+
+def parse_header(file_path, max_lines=50):
+    """
+    Parses the preamble of a Vicon CSV export:
+
+        Trajectories        (optional section name)
+        100                 (frame rate)
+        ,Subject:Marker1,,,Subject:Marker2,,,...   (optional marker names)
+        Frame,X,Y,Z,X,Y,Z,...  (a Sub Frame column is allowed)
+        ,mm,mm,mm,...       (optional units)
+        1,...               (data)
+
+    Every X, Y, Z column triple is a marker. Returns a dict with frame_rate,
+    header_row, data_row, columns and markers {name: [x, y, z column index]}.
+    """
+    with open(file_path, newline="") as f:
+        rows = []
+        for row in csv.reader(f):
+            rows.append([cell.strip() for cell in row])
+            if len(rows) >= max_lines:
+                break
+
+    header_row = next(
+        (i for i, row in enumerate(rows) if row and row[0].lower() == "frame"), None
+    )
+    if header_row is None:
+        raise Exception(f"No header row starting with 'Frame' found in {file_path}")
+    columns = rows[header_row]
+
+    # The frame rate is the only number in a row of the preamble
+    frame_rate = VICON["frame_rate"]
+    for row in rows[:header_row]:
+        values = [cell for cell in row if cell]
+        if len(values) == 1:
+            try:
+                frame_rate = float(values[0])
+                break
+            except ValueError:
+                pass
+
+    names = rows[header_row - 1] if header_row > 0 else []
+    units = rows[header_row + 1] if header_row + 1 < len(rows) else []
+    unit = next((cell for cell in units if cell in UNITS), "mm")
+
+    markers = {}
+    for i in range(len(columns) - 2):
+        if [c.upper() for c in columns[i:i + 3]] == ["X", "Y", "Z"]:
+            name = names[i] if i < len(names) and names[i] else f"marker{len(markers) + 1}"
+            markers[name] = [i, i + 1, i + 2]
+
+    if not markers:
+        raise Exception(f"No X, Y, Z marker columns found in {file_path}")
+
+    # Data starts at the first row with a frame number
+    data_row = header_row + 1
+    while data_row < len(rows) and not _is_number(rows[data_row][0] if rows[data_row] else ""):
+        data_row += 1
+
+    return {
+        "frame_rate": frame_rate,
+        "header_row": header_row,
+        "data_row": data_row,
+        "columns": columns,
+        "markers": markers,
+        "scale": UNITS[unit],
+    }
+
+
+def _is_number(cell):
+    try:
+        float(cell)
+        return True
+    except ValueError:
+        return False
+
+
+def read_markers(file_path, markers=None, chunk_rows=None):
+    """
+    Yields (frame numbers (n,), marker positions (n, M, 3) in meters) in chunks of
+    chunk_rows rows. markers selects marker names or indices, all by default.
+    Missing positions (occluded markers) are nan.
+    """
+    header = parse_header(file_path)
+    selected = _select_markers(header["markers"], markers)
+    columns = [0] + [column for name in selected for column in header["markers"][name]]
+
+    chunks = pd.read_csv(
+        file_path,
+        skiprows=header["data_row"],
+        header=None,
+        usecols=columns,
+        chunksize=chunk_rows or VICON["chunk_rows"],
+        dtype=np.float64,
+        engine="c",
+    )
+    for chunk in chunks:
+        values = chunk[columns].to_numpy()
+        yield values[:, 0].astype(np.int64), values[:, 1:].reshape(len(values), -1, 3) * header["scale"]
+
+
+def _select_markers(available, markers):
+    names = list(available)
+    if markers is None:
+        return names
+    for m in markers:
+        if isinstance(m, int) and not -len(names) <= m < len(names):
+            raise Exception(f"Marker index {m} out of range, available: {names}")
+    selected = [names[m] if isinstance(m, int) else m for m in markers]
+    for name in selected:
+        if name not in available:
+            raise Exception(f"Unknown marker {name}, available: {names}")
+    return selected
+
+
+def _cache_path(file_path, markers):
+    stat = os.stat(file_path)
+    key = f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}|{markers}|{CACHE_VERSION}"
+    digest = hashlib.sha1(key.encode()).hexdigest()
+    return os.path.join(os.path.expanduser(VICON["cache_dir"]), f"{digest}.npz")
+
+
+def load_vicon(file_path, markers=None, cache=True):
+    """
+    Returns (timestamps (N,) in seconds, poses (N, 4, 4)) of the rigid body formed by the
+    markers (VICON["markers"] by default), see poses_from_vicon. Poses of frames with
+    occluded markers are nan, see fill_occlusions. Results are cached in VICON["cache_dir"]
+    keyed by the path, size and modification time of the file, so only the first load
+    parses the CSV.
+    """
+    markers = VICON["markers"] if markers is None else markers
+    cache_path = _cache_path(file_path, markers) if cache else None
+    if cache_path and os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            return cached["timestamps"], cached["poses"]
+
+    header = parse_header(file_path)
+    timestamps = []
+    poses = []
+    reference = None
+    for frames, positions in read_markers(file_path, markers):
+        complete = ~np.isnan(positions).any(axis=(1, 2))
+        if reference is None and complete.any():
+            # Reference frame: the marker positions of the first complete frame
+            reference = positions[np.argmax(complete)]
+
+        chunk_poses = np.full((len(frames), 4, 4), np.nan)
+        if reference is not None and complete.any():
+            rotations = kabsch_rotation(reference[None], positions[complete])
+            chunk_poses[complete] = make_poses(rotations, positions[complete].mean(axis=1))
+
+        timestamps.append((frames - 1) / header["frame_rate"])
+        poses.append(chunk_poses)
+
+    timestamps = np.concatenate(timestamps) if timestamps else np.zeros(0)
+    poses = np.concatenate(poses) if poses else np.zeros((0, 4, 4))
+    log.info(f"Parsed {len(poses)} Vicon frames from {file_path}")
+
+    if cache_path:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        temporary_path = cache_path + ".tmp.npz"
+        np.savez(temporary_path, timestamps=timestamps, poses=poses)
+        os.replace(temporary_path, cache_path)
+
+    return timestamps, poses
+
+
+def fill_occlusions(poses):
+    """
+    Replaces the nan poses of occluded frames by interpolating between the neighbouring
+    complete frames, frames before the first or after the last complete one hold it.
+    """
+    complete = ~np.isnan(poses).any(axis=(1, 2))
+    if complete.all():
+        return poses
+    if not complete.any():
+        raise Exception("No frame with all markers visible")
+    indices = np.flatnonzero(complete)
+    log.info(f"Interpolated {len(poses) - len(indices)} of {len(poses)} Vicon frames with occluded markers")
+    positions = np.interp(np.arange(len(poses)), indices, np.arange(len(indices)))
+    return interpolate(poses[complete], positions)
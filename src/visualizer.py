@@ -1,92 +1,260 @@
 from src.config import DATA_DIR
-import h5py
 import numpy as np
 np.set_printoptions(precision=3, suppress=True)
-import matplotlib 
+import matplotlib
 matplotlib.use("Agg")
 import matplotlib.pyplot as plt
+from mpl_toolkits.mplot3d import proj3d
 import os
 import glob
+import queue
+import shutil
+import subprocess
+import tempfile
+import multiprocessing as mp
 import cv2
 from tqdm import tqdm
 from src.utils import set_axes_equal
-import click
+from src.episode import EpisodeReader
 
-def visualize_episode(file_path):
+VIDEO_FPS = 30.0
+AXIS_LENGTH = 0.04  # length of the drawn pose axes in meters
+AXIS_COLORS = ((0, 0, 255), (0, 255, 0), (255, 0, 0))  # x, y, z in BGR
+
+
+def visualize_episode(file_path, start=None, end=None):
+    """
+    Renders the episode, or the part between start and end seconds, to an mp4 next to the file.
+    """
     episode_name = os.path.splitext(os.path.basename(file_path))[0]
-    output_dir = os.path.dirname(file_path)
-    output_file_path = os.path.join(output_dir, f'{episode_name}.mp4')
-    f = h5py.File(file_path,'r')
+    output_file_path = video_path(file_path)
+
+    with EpisodeReader(file_path) as episode:
+        total = len(episode.between(start, end))
+
+    print(f"Generating video for {episode_name}...")
+    with tqdm(total=total, unit="frames") as progress:
+        render_video(file_path, output_file_path, start, end, progress=progress.update)
+
+    print(f"Video saved as {output_file_path}")
+
 
-    color_images = np.array(f['color_images'])
-    color_images = np.array([cv2.cvtColor(image, cv2.COLOR_BGR2RGB) for image in color_images])
+def video_path(file_path):
+    return os.path.splitext(file_path)[0] + '.mp4'
 
-    poses = np.array(f['pose_values'])
-    pose_confidences = np.array(f['pose_confidences'])
 
-    translations = np.array([pose[:3, 3] for pose in poses])
-    orientations = np.array([pose[:3, :3] for pose in poses])
-    
-    # Create figure and axis for plotting
-    
-    fig = plt.figure()
-    ax = fig.add_subplot(111, projection='3d')
+def render_video(file_path, output_file_path, start=None, end=None, frames=None, progress=None):
+    """
+    Renders the episode between start and end seconds to output_file_path. frames
+    selects a part of these frames (a slice) while the plot still shows the whole
+    trajectory, so videos of consecutive parts can be concatenated seamlessly.
+    progress is called with the number of frames rendered since the last call.
+    """
+    # Images stay BGR, the frames are written to the encoder as they are read
+    episode = EpisodeReader(file_path, rgb=False).between(start, end)
+    poses = episode['pose_values'].read()
+    frames = range(len(episode))[frames or slice(None)]
+    color_images = episode['color_images'][frames.start:frames.stop]
+
+    renderer = TrajectoryRenderer(poses)
+    frame_height, frame_width = renderer.background.shape[:2]
 
     # Initialize video writer
     fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # Codec for mp4
-    frame_height = fig.canvas.get_width_height()[1]
-    frame_width = fig.canvas.get_width_height()[0] * 2  # double the width to accommodate both images
-    out = cv2.VideoWriter(output_file_path, fourcc, 30.0, (frame_width, frame_height))
+    out = cv2.VideoWriter(output_file_path, fourcc, VIDEO_FPS, (frame_width * 2, frame_height))  # both images side by side
 
     # Generate and save frames
-    print(f"Generating video for {episode_name}...")
-    for i in tqdm(range(len(translations))):
-        color_image = color_images[i]
-        frame = create_frame(fig, ax, translations, orientations, color_image, i)
-        out.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))  # Convert RGB to BGR for OpenCV
+    for i, color_image in zip(frames, color_images):
+        out.write(renderer.render(i, color_image))
+        if progress:
+            progress(1)
 
     # Release the video writer
     out.release()
-    plt.close(fig)
+    episode.close()
+    return len(frames)
 
-    print(f"Video saved as {output_file_path}")
 
-def create_frame(fig, ax, translations, orientations, color_image, frame_idx):
-    ax.cla()  # Clear the previous frame
-    ax.set_box_aspect([1.0, 1.0, 1.0])
+def visualize_session(directory, processes=None, segment_seconds=None):
+    """
+    Renders all episodes of a session directory in a pool of processes. With
+    segment_seconds, episodes are split into parts of that length which are rendered
+    by separate workers and concatenated in order, so a few long episodes also
+    use all cores.
+    """
+    file_paths = sorted(glob.glob(os.path.join(directory, '*.h5')))
+    tasks = []  # (file path, frames, part path)
+    lengths = []  # frames of the tasks
+    parts = {}  # file path -> part paths in order
+    total = 0
+    for file_path in file_paths:
+        with EpisodeReader(file_path) as episode:
+            length = len(episode)
+        total += length
+
+        step = max(1, int(segment_seconds * VIDEO_FPS)) if segment_seconds else length
+        if step >= length:
+            tasks.append((file_path, None, video_path(file_path)))
+            lengths.append(length)
+            continue
+        parts[file_path] = []
+        for first in range(0, length, step):
+            part_path = f"{os.path.splitext(file_path)[0]}.part{len(parts[file_path]):04d}.mp4"
+            tasks.append((file_path, slice(first, first + step), part_path))
+            lengths.append(min(step, length - first))
+            parts[file_path].append(part_path)
+
+    print(f"Generating videos for {len(file_paths)} episodes in {len(tasks)} parts...")
+    progress_queue = mp.Queue()
+    pool = mp.Pool(processes, initializer=_init_worker, initargs=(progress_queue,))
+    try:
+        # Long parts first, so the pool doesn't end waiting for one of them
+        order = np.argsort(lengths)[::-1]
+        results = [pool.apply_async(_render_task, tasks[i]) for i in order]
+        with tqdm(total=total, unit="frames") as progress:
+            while not all(result.ready() for result in results):
+                try:
+                    progress.update(progress_queue.get(timeout=0.1))
+                except queue.Empty:
+                    pass
+            for result in results:
+                result.get()  # raises the exceptions of the workers
+            while not progress_queue.empty():
+                progress.update(progress_queue.get())
+
+        pool.starmap(_concatenate_task, [(part_paths, video_path(file_path)) for file_path, part_paths in parts.items()])
+    finally:
+        pool.close()
+        pool.join()
+
+    print(f"Videos saved in {directory}")
+
+
+_progress_queue = None
+
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def _render_task(file_path, frames, output_file_path):
+    # Progress is reported in batches to keep the queue traffic low
+    pending = [0]
+
+    def progress(count):
+        pending[0] += count
+        if pending[0] >= 10:
+            _progress_queue.put(pending[0])
+            pending[0] = 0
+
+    render_video(file_path, output_file_path, frames=frames, progress=progress)
+    _progress_queue.put(pending[0])
+
+
+def _concatenate_task(part_paths, output_file_path):
+    concatenate_videos(part_paths, output_file_path)
+    for part_path in part_paths:
+        os.remove(part_path)
+
+
+def concatenate_videos(part_paths, output_file_path):
+    """
+    Concatenates videos with the same format. With ffmpeg the streams are copied,
+    otherwise the frames are decoded and encoded again with OpenCV.
+    """
+    if shutil.which('ffmpeg'):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+            for part_path in part_paths:
+                f.write(f"file '{os.path.abspath(part_path)}'\n")
+        try:
+            subprocess.run(
+                ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', f.name, '-c', 'copy', output_file_path],
+                check=True,
+            )
+        finally:
+            os.remove(f.name)
+        return
+
+    out = None
+    for part_path in part_paths:
+        capture = cv2.VideoCapture(part_path)
+        while True:
+            success, frame = capture.read()
+            if not success:
+                break
+            if out is None:
+                fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+                out = cv2.VideoWriter(output_file_path, fourcc, VIDEO_FPS, (frame.shape[1], frame.shape[0]))
+            out.write(frame)
+        capture.release()
+    if out is not None:
+        out.release()
+
+
+class TrajectoryRenderer:
+    """
+    Renders frames of the trajectory plot next to the camera image. The 3D plot of
+    the whole trajectory is drawn once with matplotlib and all pose axes are projected
+    to its pixels up front, so a frame is a copy of the background with three lines
+    drawn by OpenCV. Frames are BGR.
+    """
+
+    def __init__(self, poses, figure_size=None):
+        translations = poses[:, :3, 3]
+        orientations = poses[:, :3, :3]
 
-    # Plot trajectory
-    ax.plot(translations[:, 0], translations[:, 1], translations[:, 2], '-', c="lightgrey", label='Trajectory')
+        fig = plt.figure(figsize=figure_size)
+        ax = fig.add_subplot(111, projection='3d')
+        ax.set_box_aspect([1.0, 1.0, 1.0])
 
-    # Plot orientation arrows
-    t = translations[frame_idx]
-    R = orientations[frame_idx]
+        # Plot trajectory
+        ax.plot(translations[:, 0], translations[:, 1], translations[:, 2], '-', c="lightgrey", label='Trajectory')
 
-    ax.quiver(t[0], t[1], t[2], R[0, 0], R[1, 0], R[2, 0], length=0.04, color='r', arrow_length_ratio=0)
-    ax.quiver(t[0], t[1], t[2], R[0, 1], R[1, 1], R[2, 1], length=0.04, color='g', arrow_length_ratio=0)
-    ax.quiver(t[0], t[1], t[2], R[0, 2], R[1, 2], R[2, 2], length=0.04, color='b', arrow_length_ratio=0)
+        ax.set_xlabel('X')
+        ax.set_ylabel('Y')
+        ax.set_zlabel('Z')
 
-    ax.set_xlabel('X')
-    ax.set_ylabel('Y')
-    ax.set_zlabel('Z')
+        ax.grid(True)
+        ax.view_init(elev=-30, azim=-90, roll=0)
 
-    ax.grid(True)
-    ax.view_init(elev=-30, azim=-90, roll=0)
-    
-    set_axes_equal(ax)
+        set_axes_equal(ax)
 
-    fig.canvas.draw()
-    # plt.show()
+        fig.canvas.draw()
+        background = np.asarray(fig.canvas.buffer_rgba())[:, :, :3]
+        self.background = cv2.cvtColor(background, cv2.COLOR_RGB2BGR)
 
-    # Convert the plot to a numpy array
-    trajectory_frame = np.frombuffer(fig.canvas.buffer_rgba(), dtype=np.uint8)
-    trajectory_frame = trajectory_frame.reshape(fig.canvas.get_width_height()[::-1] + (4,))[:, :, :3]
+        # Origins and tips of the x, y and z axes of every pose, (N, 4, 3)
+        points = np.concatenate(
+            [translations[:, None], translations[:, None] + AXIS_LENGTH * np.swapaxes(orientations, 1, 2)],
+            axis=1,
+        )
+        self.pixels = self.project(fig, ax, points.reshape(-1, 3)).reshape(len(poses), 4, 2)
+        plt.close(fig)
 
+    def project(self, fig, ax, points):
+        """
+        Pixel coordinates (N, 2) of 3D points (N, 3) in the drawn figure, 1/16 pixel fixed point.
+        """
+        x, y, _ = proj3d.proj_transform(points[:, 0], points[:, 1], points[:, 2], ax.get_proj())
+        display = ax.transData.transform(np.column_stack([x, y]))
+        display[:, 1] = self.background.shape[0] - display[:, 1]  # display coordinates start at the bottom
+        display = np.nan_to_num(display, nan=-1e4, posinf=1e4, neginf=-1e4)
+        return np.round(np.clip(display, -1e4, 1e4) * 16).astype(np.int32)
 
-    # Resize color image to match the height of the trajectory plot
-    color_image_resized = cv2.resize(color_image, (trajectory_frame.shape[1], trajectory_frame.shape[0]))
+    def render(self, frame_idx, color_image):
+        """
+        Returns the trajectory plot with the pose of frame_idx next to the color image.
+        """
+        frame_height, frame_width = self.background.shape[:2]
+        frame = np.empty((frame_height, frame_width * 2, 3), dtype=np.uint8)
 
-    # Concatenate the two images side by side
-    combined_frame = np.concatenate((trajectory_frame, color_image_resized), axis=1)
+        plot = frame[:, :frame_width]
+        plot[:] = self.background
+        origin, *tips = self.pixels[frame_idx]
+        for tip, color in zip(tips, AXIS_COLORS):
+            cv2.line(plot, tuple(origin), tuple(tip), color, 2, cv2.LINE_AA, shift=4)
 
-    return combined_frame
\ No newline at end of file
+        # Resize color image to match the height of the trajectory plot
+        cv2.resize(color_image, (frame_width, frame_height), dst=frame[:, frame_width:])
+        return frame
@@ -0,0 +1,39 @@
+import h5py
+import numpy as np
+
+from src.catalog import open_catalog, scan
+from src.dataset import convert_sessions
+
+
+def write_episode(file_path, frames=10):
+    poses = np.tile(np.eye(4), (frames, 1, 1))
+    poses[:, 0, 3] = np.linspace(0, 0.1, frames)
+    with h5py.File(file_path, "w") as f:
+        f["timestamps"] = np.arange(frames, dtype=np.uint64) * 33_333_333
+        f["pose_values"] = poses
+        f["pose_confidences"] = np.full(frames, 100, dtype=np.uint8)
+        f["gripper_states"] = np.zeros(frames, dtype=np.uint8)
+
+
+def test_scan_skips_converted_dataset(tmp_path):
+    data_dir = tmp_path / "data"
+    session = data_dir / "session_20240626_124925_lab"
+    session.mkdir(parents=True)
+    write_episode(session / "episode_0.h5")
+    write_episode(session / "episode_1.h5", frames=20)
+    # Neither are episodes, both are skipped by the conversion and the scan
+    with h5py.File(session / "cache.h5", "w") as f:
+        f["values"] = np.zeros(3)
+    (session / "partial.h5").write_bytes(b"not hdf5")
+
+    # A dataset converted into DATA_DIR, e.g. with an explicit output directory
+    assert convert_sessions([str(data_dir)], str(data_dir / "dataset"), processes=1) == (2, 0, 0)
+
+    connection = open_catalog(str(data_dir / "catalog.sqlite"))
+    assert scan(connection) == (2, 0, 0)
+    paths = sorted(row["path"] for row in connection.execute("SELECT path FROM episodes"))
+    assert paths == ["session_20240626_124925_lab/episode_0.h5", "session_20240626_124925_lab/episode_1.h5"]
+
+    # Converting again adds nothing to the catalog
+    assert convert_sessions([str(data_dir)], str(data_dir / "dataset"), processes=1) == (0, 2, 0)
+    assert scan(connection) == (0, 2, 0)
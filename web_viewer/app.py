@@ -1,62 +1,116 @@
 #!/usr/bin/env python
-from flask import Flask, render_template, Response
-import cv2
+from flask import Flask, render_template, Response, request
+import logging
+import os
+import threading
 import numpy as np
 
-from src.components.tracker import Tracker
-from src.components.camera import Camera
+try:
+    from flask_sock import Sock  # WebSocket telemetry
+except ImportError:
+    Sock = None
 
+from src.config import VIEWER, RECORDER
+from src.preview import FrameBroadcaster, RecorderSource, BOUNDARY, depth_colormap
+from src.telemetry import TelemetrySampler
 
-type = "RealSense" 
+log = logging.getLogger(__name__)
+
+
+type = os.environ.get("VIEWER_SOURCE", VIEWER["source"])
 
 app = Flask(__name__)
+sock = Sock(app) if Sock is not None else None
 
 
 if type == "RealSense":
+    from src.components.camera import Camera
     cam = Camera()
 elif type == "ZED":
+    from src.components.tracker import Tracker
     cam = Tracker()
+elif type == "recorder":
+    cam = None  # images are read from the shared memory of record_session.py
 else:
     print("Invalid type")
 
 
-def get_frame():
-    while True:
-        if type == "RealSense":
-            cam.wait_for_frames()
-            image = cam.get_image()  
-            depth = cam.get_depth()
-            
-            max_depth = 0.6 # meters
-            max_depth_bit = 10000*max_depth
-            depth[depth>max_depth_bit] = max_depth_bit
-            
-            # Convert depth to 8-bit and BGR for OpenCV
-            depth_image_normalized = cv2.normalize(depth, None, 0, 255, cv2.NORM_MINMAX)
-            depth_image_8bit = np.uint8(depth_image_normalized)
-            depth_colormap = cv2.applyColorMap(depth_image_8bit, cv2.COLORMAP_JET)
-            # depth_bgr = cv2.cvtColor(depth_colormap, cv2.COLOR_RGB2BGR)
-
-            imgencode=cv2.imencode('.jpg',np.hstack((image, depth_colormap)))[1]
-        elif type == "ZED":
-            cam.grab_frame()
-            _, image = cam.get_image()
-            imgencode=cv2.imencode('.jpg',image)[1]
-        
-        stringData=imgencode.tostring()
-        yield (b'--frame\r\n'
-            b'Content-Type: text/plain\r\n\r\n'+stringData+b'\r\n')
+def capture_realsense():
+    if not cam.wait_for_frames():
+        log.warning("No frames received from RealSense camera")
+        return None  # the broadcaster keeps capturing
+    image = cam.get_image()
+    depth = cam.get_depth()
+    return np.hstack((image, depth_colormap(depth, max_depth=0.6)))
+
+
+def capture_zed():
+    if not cam.grab_frame():
+        log.warning("No frames received from ZED camera")
+        return None
+    _, image = cam.get_image()
+    return image
+
+
+# A single thread per image source captures and encodes the frames for all clients
+broadcasters = {}
+broadcasters_lock = threading.Lock()
+
+
+def get_broadcaster(stream):
+    with broadcasters_lock:
+        if stream not in broadcasters:
+            if type == "recorder":
+                capture = RecorderSource(stream)
+            else:
+                capture = capture_realsense if type == "RealSense" else capture_zed
+            broadcasters[stream] = FrameBroadcaster(capture)
+        return broadcasters[stream]
 
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return render_template(
+        'index.html', source=type, tracking_image=RECORDER["tracking_image"], telemetry=sock is not None
+    )
 
 
 @app.route('/video')
 def video():
-    return Response(get_frame(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    """
+    Optional query parameters: fps, scale (0.05 to 1) and quality (1 to 100), e.g. /video?fps=10&scale=0.5
+    In recorder mode, stream selects the recorder stream ("camera" or "tracker_image").
+    """
+    stream = request.args.get('stream', 'camera') if type == "recorder" else type
+    try:
+        broadcaster = get_broadcaster(stream)
+    except Exception as e:
+        return str(e), 404
+    fps = request.args.get('fps', type=float)
+    scale = float(np.clip(request.args.get('scale', 1.0, type=float), 0.05, 1.0))
+    quality = request.args.get('quality', type=int)
+    if quality is not None:
+        quality = int(np.clip(quality, 1, 100))
+    return Response(
+        broadcaster.subscribe(fps, scale, quality),
+        mimetype='multipart/x-mixed-replace; boundary=' + BOUNDARY.decode(),
+    )
+
+
+# Pose, trigger and gripper state of a running recorder, sampled by a single thread for all clients
+telemetry_sampler = TelemetrySampler()
+
+
+if sock is not None:
+    @sock.route('/telemetry')
+    def telemetry(ws):
+        """
+        Sends the record format as JSON, then binary messages of packed records (see src/telemetry.py).
+        """
+        ws.send(telemetry_sampler.header())
+        for batch in telemetry_sampler.batches():
+            ws.send(batch)
 
 
 if __name__ == '__main__':
-    app.run(host='localhost', port=5000, debug=True, threaded=True)
\ No newline at end of file
+    app.run(host='localhost', port=5000, debug=True, threaded=True)
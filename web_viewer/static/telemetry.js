@@ -0,0 +1,139 @@
+// Live pose, confidence, trigger and gripper state from the /telemetry WebSocket.
+// The first message describes the packed records (see src/telemetry.py), every
+// following binary message holds all samples since the previous one.
+
+const MAX_POINTS = 5000;
+
+function startTelemetry(canvas, status) {
+  const context = canvas.getContext("2d");
+  const points = [];  // [x, y, z]
+  let latest = null;
+  let format = null;
+  let received = 0;
+  let yaw = -0.8, pitch = 0.5;  // view direction in radians, changed by dragging
+
+  const types = {
+    f8: [8, "getFloat64"],
+    f4: [4, "getFloat32"],
+    u1: [1, "getUint8"],
+  };
+
+  function parse(buffer) {
+    const view = new DataView(buffer);
+    const samples = [];
+    for (let offset = 0; offset + format.record_size <= buffer.byteLength; offset += format.record_size) {
+      const sample = {};
+      for (const [name, [fieldOffset, type, count]] of Object.entries(format.fields)) {
+        const [size, getter] = types[type];
+        const values = [];
+        for (let i = 0; i < count; i++) {
+          values.push(view[getter](offset + fieldOffset + i * size, true));
+        }
+        sample[name] = count === 1 ? values[0] : values;
+      }
+      samples.push(sample);
+    }
+    return samples;
+  }
+
+  function connect() {
+    const protocol = location.protocol === "https:" ? "wss:" : "ws:";
+    const socket = new WebSocket(`${protocol}//${location.host}/telemetry`);
+    socket.binaryType = "arraybuffer";
+    socket.onmessage = (event) => {
+      if (typeof event.data === "string") {
+        format = JSON.parse(event.data);
+        return;
+      }
+      for (const sample of parse(event.data)) {
+        points.push(sample.position);
+        latest = sample;
+        received++;
+      }
+      if (points.length > MAX_POINTS) {
+        points.splice(0, points.length - MAX_POINTS);
+      }
+    };
+    socket.onclose = () => setTimeout(connect, 1000);
+  }
+
+  function rotationMatrix([x, y, z, w]) {
+    return [
+      [1 - 2 * (y * y + z * z), 2 * (x * y - z * w), 2 * (x * z + y * w)],
+      [2 * (x * y + z * w), 1 - 2 * (x * x + z * z), 2 * (y * z - x * w)],
+      [2 * (x * z - y * w), 2 * (y * z + x * w), 1 - 2 * (x * x + y * y)],
+    ];
+  }
+
+  function draw() {
+    const width = canvas.width, height = canvas.height;
+    context.clearRect(0, 0, width, height);
+
+    if (points.length) {
+      // Fit the bounding box of the trajectory into the canvas
+      const min = [Infinity, Infinity, Infinity], max = [-Infinity, -Infinity, -Infinity];
+      for (const p of points) {
+        for (let i = 0; i < 3; i++) {
+          min[i] = Math.min(min[i], p[i]);
+          max[i] = Math.max(max[i], p[i]);
+        }
+      }
+      const center = min.map((value, i) => (value + max[i]) / 2);
+      const extent = Math.max(max[0] - min[0], max[1] - min[1], max[2] - min[2], 0.1);
+      const scale = 0.8 * Math.min(width, height) / extent;
+
+      const cy = Math.cos(yaw), sy = Math.sin(yaw), cp = Math.cos(pitch), sp = Math.sin(pitch);
+      const project = (p) => {
+        const x = p[0] - center[0], y = p[1] - center[1], z = p[2] - center[2];
+        const u = cy * x - sy * y;
+        const v = sp * (sy * x + cy * y) + cp * z;
+        return [width / 2 + scale * u, height / 2 - scale * v];
+      };
+
+      context.strokeStyle = "lightgrey";
+      context.lineWidth = 1;
+      context.beginPath();
+      points.forEach((p, i) => {
+        const [u, v] = project(p);
+        i ? context.lineTo(u, v) : context.moveTo(u, v);
+      });
+      context.stroke();
+
+      // Axes of the latest pose
+      const R = rotationMatrix(latest.quaternion);
+      const origin = project(latest.position);
+      context.lineWidth = 2;
+      ["red", "green", "blue"].forEach((color, axis) => {
+        const tip = project(latest.position.map((value, i) => value + 0.1 * extent * R[i][axis]));
+        context.strokeStyle = color;
+        context.beginPath();
+        context.moveTo(...origin);
+        context.lineTo(...tip);
+        context.stroke();
+      });
+    }
+
+    if (latest) {
+      const age = Date.now() / 1000 - latest.time;
+      status.textContent =
+        `confidence ${latest.confidence}  trigger ${latest.trigger}  gripper ${latest.gripper}  ` +
+        `position [${latest.position.map((value) => value.toFixed(3)).join(", ")}]  ` +
+        `${received} samples, ${(age * 1000).toFixed(0)} ms old`;
+    } else {
+      status.textContent = "Waiting for the recorder...";
+    }
+    requestAnimationFrame(draw);
+  }
+
+  let drag = null;
+  canvas.addEventListener("mousedown", (event) => (drag = [event.clientX, event.clientY, yaw, pitch]));
+  window.addEventListener("mouseup", () => (drag = null));
+  window.addEventListener("mousemove", (event) => {
+    if (!drag) return;
+    yaw = drag[2] + (event.clientX - drag[0]) * 0.01;
+    pitch = Math.max(-Math.PI / 2, Math.min(Math.PI / 2, drag[3] + (event.clientY - drag[1]) * 0.01));
+  });
+
+  connect();
+  requestAnimationFrame(draw);
+}